@@ -47,6 +47,16 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_recommender() -> MusicRecommender:
+    """进程内共享的推荐器，保留索引和分页会话；创建时预热，避免首个请求承担加载开销
+    
+    各浏览器会话在各自线程中并发使用同一个实例：请求的用户历史和偏好只保存在请求上下文中，不写入实例。
+    """
+    recommender = MusicRecommender()
+    recommender.warm_up()
+    return recommender
+
 def main():
     # 主标题
     st.markdown('<h1 class="main-header">🎵 AI音乐推荐系统</h1>', unsafe_allow_html=True)
@@ -62,11 +72,14 @@ def main():
         # 推荐设置
         st.subheader("推荐设置")
         num_recommendations = st.slider("推荐歌曲数量", 5, 20, 10)
+        diversity = st.slider("多样性", 0.0, 1.0, 0.0, 0.1, help="越大越倾向于选择与已选歌曲不相似的歌曲")
+        limit_artist = st.checkbox("限制每位歌手的歌曲数")
+        artist_cap = st.number_input("每位歌手最多", 1, 10, 2) if limit_artist else None
         
         # 生成新的用户历史
         if st.button("🔄 生成新的用户历史"):
             st.session_state.user_history = generate_user_history(history_size)
-            st.session_state.recommendations = None
+            st.session_state.pop('recommendations', None)
             st.success("已生成新的用户听歌历史！")
         
         # 显示当前用户历史
@@ -85,10 +98,10 @@ def main():
             st.session_state.user_history = generate_user_history(history_size)
         
         # 初始化推荐器
-        recommender = MusicRecommender()
+        recommender = get_recommender()
         
         # 分析用户偏好
-        preferences = recommender.analyze_user_history(st.session_state.user_history)
+        preferences = recommender.summarize_user_history(st.session_state.user_history)
         
         # 显示偏好统计
         col1_1, col1_2 = st.columns(2)
@@ -135,13 +148,20 @@ def main():
     with col2:
         st.header("🎵 推荐歌单")
         
-        # 获取推荐
+        # 获取推荐（分页会话，"加载更多"只计算下一页）
         if st.button("🎯 生成推荐") or 'recommendations' not in st.session_state:
             with st.spinner("正在分析用户偏好并生成推荐..."):
-                st.session_state.recommendations = recommender.get_recommendations(
-                    st.session_state.user_history, 
-                    num_recommendations
-                )
+                session = recommender.start_session(st.session_state.user_history, diversity=diversity,
+                                                    artist_cap=artist_cap)
+                st.session_state.recommendations = recommender.next_page(session.session_id, num_recommendations)
+        
+        if st.session_state.recommendations.get('has_more') and st.button("➕ 加载更多"):
+            try:
+                page = recommender.next_page(st.session_state.recommendations['session_id'], num_recommendations)
+                page['recommendations'] = st.session_state.recommendations['recommendations'] + page['recommendations']
+                st.session_state.recommendations = page
+            except ValueError:
+                st.warning("推荐会话已过期，请重新生成推荐")
         
         # 显示推荐结果
         if 'recommendations' in st.session_state:
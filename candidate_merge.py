@@ -0,0 +1,75 @@
+"""
+候选合并 - 把多个按分数排序的惰性候选流合并为一个不重复的推荐流
+
+每个候选流产出 (歌曲ID, 分数)，且分数单调不增。合并阶段按需从各流拉取，
+凑够所需数量即停止，未被用到的候选流不会产生额外开销。
+
+合并策略：
+- chain: 依次消耗各候选流，每个流最多取 per_stream_limit 个（与早期的拼接去重一致）
+- interleave: 轮流从各候选流各取一个
+- score: 按 "权重 × 分数 / 该流最高分" 做k路归并，分数高者优先
+"""
+
+import heapq
+from itertools import islice
+from typing import List, Dict, Iterator, Optional, Tuple
+
+MERGE_STRATEGIES = ("chain", "interleave", "score")
+
+def _chain(streams, per_stream_limit):
+    for source, stream in streams:
+        # islice 在取满后不再拉取，避免为第 limit+1 个候选多触发一轮检索
+        for song_id, score in islice(stream, per_stream_limit):
+            yield song_id, score, source
+
+def _interleave(streams):
+    active = [(source, iter(stream)) for source, stream in streams]
+    while active:
+        remaining = []
+        for source, stream in active:
+            item = next(stream, None)
+            if item is not None:
+                yield item[0], item[1], source
+                remaining.append((source, stream))
+        active = remaining
+
+def _score_fused(streams, weights):
+    heap = []
+    for order, (source, stream) in enumerate(streams):
+        stream = iter(stream)
+        first = next(stream, None)
+        if first is None:
+            continue
+        # 以各流的最高分归一化，使不同量纲的分数可以比较
+        scale = abs(first[1]) or 1.0
+        weight = weights.get(source, 1.0)
+        heap.append((-weight * first[1] / scale, order, first, source, stream, scale, weight))
+    heapq.heapify(heap)
+
+    while heap:
+        _, order, (song_id, score), source, stream, scale, weight = heapq.heappop(heap)
+        yield song_id, score, source
+        item = next(stream, None)
+        if item is not None:
+            heapq.heappush(heap, (-weight * item[1] / scale, order, item, source, stream, scale, weight))
+
+def merge_candidates(streams: List[Tuple[str, Iterator[Tuple[int, float]]]], music_data: List[Dict],
+                     strategy: str = "chain", exclude_titles: Optional[set] = None,
+                     per_stream_limit: Optional[int] = None,
+                     weights: Optional[Dict[str, float]] = None) -> Iterator[Tuple[int, float, str]]:
+    """合并候选流，惰性产出标题不重复的 (歌曲ID, 分数, 来源)"""
+    if strategy == "chain":
+        merged = _chain(streams, per_stream_limit)
+    elif strategy == "interleave":
+        merged = _interleave(streams)
+    elif strategy == "score":
+        merged = _score_fused(streams, weights or {})
+    else:
+        raise ValueError(f"未知的候选合并策略: {strategy}")
+
+    seen_titles = set(exclude_titles or ())
+    for song_id, score, source in merged:
+        title = music_data[song_id]['title']
+        if title not in seen_titles:
+            seen_titles.add(title)
+            yield song_id, score, source
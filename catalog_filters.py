@@ -0,0 +1,81 @@
+"""
+曲库属性过滤 - 把情绪、流派、年份范围约束转换为歌曲ID掩码
+
+过滤条件是一个 dict，例如 {'mood': 'sad', 'genre': ['Pop', 'Rock'], 'year_range': (1990, 2010)}，
+取值为字符串或字符串列表；year_range 为闭区间，任一端可以为 None。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import numpy as np
+
+FILTER_FIELDS = ("mood", "genre")
+
+def normalize_filters(filters: Optional[Dict]) -> Optional[tuple]:
+    """把过滤条件规范化为可哈希的键，没有有效条件时返回None"""
+    if not filters:
+        return None
+    key = []
+    for field in FILTER_FIELDS:
+        values = filters.get(field)
+        if values:
+            if isinstance(values, str):
+                values = [values]
+            key.append((field, tuple(sorted(values))))
+    year_range = filters.get('year_range')
+    if year_range and any(bound is not None for bound in year_range):
+        key.append(('year_range', tuple(year_range)))
+    return tuple(key) or None
+
+class CatalogAttributeIndex:
+    """曲库属性倒排索引，按过滤条件生成允许的歌曲ID掩码"""
+
+    def __init__(self, music_data: List[Dict], cache_size: int = 64):
+        self.num_songs = len(music_data)
+        self.values = {field: {} for field in FILTER_FIELDS}
+        for song_id, song in enumerate(music_data):
+            for field in FILTER_FIELDS:
+                self.values[field].setdefault(song[field], []).append(song_id)
+        self.values = {
+            field: {value: np.array(ids, dtype=np.int64) for value, ids in postings.items()}
+            for field, postings in self.values.items()
+        }
+        self.years = np.array([song['year'] for song in music_data], dtype=np.int32)
+        self.cache_size = cache_size
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """返回满足过滤条件的布尔掩码，没有条件时返回None（结果只读、会被缓存）"""
+        key = normalize_filters(filters)
+        if key is None:
+            return None
+        with self._lock:
+            cached = self._masks.get(key)
+            if cached is not None:
+                self._masks.move_to_end(key)
+                return cached
+
+        mask = np.ones(self.num_songs, dtype=bool)
+        for field, values in key:
+            if field == 'year_range':
+                low, high = values
+                if low is not None:
+                    mask &= self.years >= low
+                if high is not None:
+                    mask &= self.years <= high
+            else:
+                field_mask = np.zeros(self.num_songs, dtype=bool)
+                for value in values:
+                    ids = self.values[field].get(value)
+                    if ids is not None:
+                        field_mask[ids] = True
+                mask &= field_mask
+
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > self.cache_size:
+                self._masks.popitem(last=False)
+        return mask
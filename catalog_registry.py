@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+多曲库注册表 - 一个进程按名称服务多个曲库（如不同地区、不同厂牌）
+
+所有曲库共享进程内唯一的嵌入模型（见 music_embeddings.get_embedding_model），每个曲库有各自的
+MusicRecommender。曲库数据和检索索引都在第一次请求该曲库时才加载，加载只持有该曲库自己的锁，
+不影响其他曲库的请求。推荐器的每次索引加载（包括被释放后由检索重新加载）都通过 on_index_loaded
+回调计入占用；已加载索引的估算占用超过内存预算时，按最久未使用的顺序释放其他曲库的索引，
+并丢弃这些曲库仍引用旧索引的分页会话（曲库数据和用户缓存保留）。最近使用的曲库即使单独超出预算也会保留。
+"""
+
+import argparse
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Callable, Optional
+from tabulate import tabulate
+
+from music_data import load_music_data_from_file
+from music_recommender import MusicRecommender, SIMILARITY_BACKENDS
+
+# 已加载索引的默认内存预算（字节）
+DEFAULT_INDEX_MEMORY_BUDGET = 1024 * 1024 * 1024
+
+class _CatalogEntry:
+    __slots__ = ("loader", "options", "recommender", "lock")
+
+    def __init__(self, loader: Callable[[], List[Dict]], options: Dict):
+        self.loader = loader
+        self.options = options
+        self.recommender: Optional[MusicRecommender] = None
+        # 只串行化同一曲库的加载
+        self.lock = threading.Lock()
+
+class CatalogRegistry:
+    """按名称管理多个曲库的推荐器，在内存预算内按最近使用保留检索索引"""
+
+    def __init__(self, memory_budget: int = DEFAULT_INDEX_MEMORY_BUDGET, **recommender_options):
+        self.memory_budget = memory_budget
+        self.recommender_options = recommender_options
+        self.loads = 0
+        self.evictions = 0
+        self._catalogs: Dict[str, _CatalogEntry] = {}
+        # 已加载索引的曲库及其估算占用，按最近使用排列
+        self._resident: "OrderedDict[str, int]" = OrderedDict()
+        # 只保护注册表和占用统计，不在持有时加载曲库或索引
+        self._lock = threading.Lock()
+
+    def register(self, name: str, music_data: Optional[List[Dict]] = None,
+                 database: Optional[str] = None, compact: bool = False, **options):
+        """注册曲库：直接给出曲库数据，或给出曲库文件路径（首次使用时加载）
+
+        compact 为True时曲库文件以紧凑歌曲记录加载（见 compact_catalog）。
+        options 覆盖该曲库推荐器的构造参数，例如各自的 index_path。
+        """
+        if (music_data is None) == (database is None):
+            raise ValueError("注册曲库需要且只能提供 music_data 或 database 之一")
+        with self._lock:
+            if name in self._catalogs:
+                raise ValueError(f"曲库已注册: {name}")
+            loader = (lambda: music_data) if music_data is not None else (lambda: load_music_data_from_file(database, compact))
+            self._catalogs[name] = _CatalogEntry(loader, options)
+
+    def unregister(self, name: str):
+        with self._lock:
+            entry = self._catalogs.pop(name, None)
+            self._resident.pop(name, None)
+        if entry is not None and entry.recommender is not None:
+            entry.recommender.on_index_loaded = None
+            entry.recommender.release_indexes()
+
+    def names(self) -> List[str]:
+        return list(self._catalogs)
+
+    def get(self, name: str) -> MusicRecommender:
+        """返回曲库的推荐器，必要时加载曲库和索引，并按内存预算释放其他曲库的索引"""
+        with self._lock:
+            entry = self._catalogs.get(name)
+            if entry is None:
+                raise ValueError(f"未注册的曲库: {name}")
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                return entry.recommender
+
+        # 曲库数据和索引在全局锁之外加载，其他曲库的请求不受影响
+        with entry.lock:
+            if entry.recommender is None:
+                recommender = MusicRecommender(entry.loader(), **{**self.recommender_options, **entry.options})
+                recommender.on_index_loaded = lambda r: self._index_loaded(name, r)
+                entry.recommender = recommender
+            entry.recommender.load_index()
+
+        with self._lock:
+            # neighbors 模式等不加载索引的曲库也记入，占用为0
+            if name not in self._resident and self._catalogs.get(name) is entry:
+                self._resident[name] = entry.recommender.index_memory_bytes()
+            if name in self._resident:
+                self._resident.move_to_end(name)
+        return entry.recommender
+
+    def _index_loaded(self, name: str, recommender: MusicRecommender):
+        """推荐器加载索引后更新占用统计，并按预算释放其他曲库的索引"""
+        with self._lock:
+            entry = self._catalogs.get(name)
+            if entry is None or entry.recommender is not recommender:
+                return
+            self._resident[name] = recommender.index_memory_bytes()
+            self._resident.move_to_end(name)
+            self.loads += 1
+            self._evict(keep=name)
+
+    def _evict(self, keep: str):
+        # 调用方需持有锁；release_indexes 只清除引用，不会回调注册表
+        while self._resident_bytes() > self.memory_budget:
+            # 不占用索引内存的曲库（如 neighbors 模式）释放后腾不出空间，跳过以免丢弃其分页会话
+            victim = next((n for n, size in self._resident.items() if n != keep and size > 0), None)
+            if victim is None:
+                break
+            del self._resident[victim]
+            self._catalogs[victim].recommender.release_indexes()
+            self.evictions += 1
+
+    def _resident_bytes(self) -> int:
+        return sum(self._resident.values())
+
+    def resident_bytes(self) -> int:
+        """已加载索引的估算总占用"""
+        with self._lock:
+            return self._resident_bytes()
+
+    def resident(self) -> List[str]:
+        """已加载索引的曲库，从最久未使用到最近使用"""
+        with self._lock:
+            return list(self._resident)
+
+    def get_recommendations(self, name: str, user_history: List[Dict], num_recommendations: int = 10,
+                            **kwargs) -> Dict:
+        """在指定曲库中生成推荐"""
+        return self.get(name).get_recommendations(user_history, num_recommendations, **kwargs)
+
+def main():
+    from music_data import generate_user_history
+
+    parser = argparse.ArgumentParser(description="多曲库注册表 - 按内存预算加载和释放索引")
+    parser.add_argument('--catalog', action='append', required=True, metavar='NAME=PATH',
+                        help='注册曲库文件，可重复指定')
+    parser.add_argument('--memory-budget-mb', type=float, default=DEFAULT_INDEX_MEMORY_BUDGET / (1024 * 1024),
+                        help='已加载索引的内存预算(MB) (默认: 1024)')
+    parser.add_argument('--similarity-backend', choices=SIMILARITY_BACKENDS, default='embedding',
+                        help='相似度检索后端 (默认: embedding)')
+    parser.add_argument('--compact-catalog', action='store_true', help='以紧凑歌曲记录加载曲库文件')
+    parser.add_argument('--recommendations', type=int, default=5, help='每个曲库推荐歌曲数量 (默认: 5)')
+    args = parser.parse_args()
+
+    registry = CatalogRegistry(int(args.memory_budget_mb * 1024 * 1024), similarity_backend=args.similarity_backend)
+    for spec in args.catalog:
+        name, sep, path = spec.partition('=')
+        if not sep:
+            parser.error(f"曲库参数格式应为 NAME=PATH: {spec}")
+        registry.register(name, database=path, compact=args.compact_catalog)
+
+    user_history = generate_user_history(8)
+    rows = []
+    for name in registry.names():
+        result = registry.get_recommendations(name, user_history, args.recommendations)
+        titles = ", ".join(song['title'] for song in result['recommendations'])
+        rows.append([name, f"{registry.resident_bytes() / (1024 * 1024):.1f}", ", ".join(registry.resident()), titles])
+
+    print(tabulate(rows, headers=["曲库", "索引占用(MB)", "已加载索引", "推荐"], tablefmt="grid"))
+    print(f"\n📦 索引加载 {registry.loads} 次，释放 {registry.evictions} 次")
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,13 @@ import sys
 from typing import List, Dict
 from tabulate import tabulate
 
-from music_data import get_all_music_data, generate_user_history
-from music_recommender import MusicRecommender
+from music_data import get_all_music_data, load_music_data_from_file, generate_user_history
+from music_recommender import MusicRecommender, SIMILARITY_MODES, SIMILARITY_BACKENDS, CANDIDATE_GENERATORS
+from candidate_merge import MERGE_STRATEGIES
+from history_store import ListenHistoryStore
+from recommendation_export import RecommendationParquetWriter
+from neighbor_table import NeighborTable, DEFAULT_NEIGHBOR_TABLE_PATH
+from popularity_rankings import PopularityRankings
 
 def print_banner():
     """打印系统横幅"""
@@ -92,7 +97,7 @@ def save_recommendations_to_file(recommendations: Dict, filename: str):
     """保存推荐结果到文件"""
     try:
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(recommendations, f, ensure_ascii=False, indent=2)
+            json.dump(recommendations, f, ensure_ascii=False, indent=2, default=dict)
         print(f"\n💾 推荐结果已保存到: {filename}")
     except Exception as e:
         print(f"\n❌ 保存文件失败: {e}")
@@ -116,6 +121,58 @@ def export_playlist_to_txt(recommendations: Dict, filename: str):
     except Exception as e:
         print(f"\n❌ 导出歌单失败: {e}")
 
+def export_recommendations_to_parquet(recommendations: Dict, user_id: str, filename: str):
+    """导出推荐结果到Parquet文件"""
+    try:
+        with RecommendationParquetWriter(filename) as writer:
+            writer.append(user_id, recommendations)
+        print(f"\n🗂️  推荐结果已导出到: {filename}")
+    except Exception as e:
+        print(f"\n❌ 导出Parquet失败: {e}")
+
+def build_recommender(args, history_store: ListenHistoryStore = None) -> MusicRecommender:
+    """按命令行参数构建推荐器"""
+    neighbor_table = None
+    if args.similarity_mode == 'neighbors' or 'neighbors' in args.generators:
+        neighbor_table = NeighborTable.load(args.neighbor_table)
+    return MusicRecommender(
+        music_data=load_music_data_from_file(args.database, compact=args.compact_catalog) if args.database else None,
+        similarity_mode=args.similarity_mode,
+        neighbor_table=neighbor_table,
+        similarity_backend=args.similarity_backend,
+        embed_batch_size=args.embed_batch_size,
+        embed_threads=args.embed_threads,
+        embed_workers=args.embed_workers,
+        index_path=args.index_path,
+        nprobe=args.nprobe,
+        history_store=history_store,
+        candidate_generators=args.generators,
+        merge_strategy=args.merge_strategy,
+        diversity=args.diversity,
+        artist_cap=args.artist_cap,
+        diversity_pool_size=args.diversity_pool,
+        popularity_rankings=PopularityRankings.load(args.rankings) if args.rankings else None,
+        rankings_refresh_interval=args.rankings_refresh_interval or None
+    )
+
+def run_warm_up(args) -> bool:
+    """预热推荐器并显示就绪状态"""
+    print("🔥 预热推荐系统...")
+    recommender = build_recommender(args)
+    report = recommender.warm_up(args.queries, args.recommendations, args.latency_target_ms)
+    
+    table_data = [[name, f"{ms:.1f}"] for name, ms in report['timings'].items()]
+    for i, ms in enumerate(report['query_latencies_ms'], 1):
+        table_data.append([f"query_{i}_ms", f"{ms:.1f}"])
+    table_data.append(["total_ms", f"{report['total_ms']:.1f}"])
+    print(tabulate(table_data, headers=["阶段", "耗时(ms)"], tablefmt="grid"))
+    
+    if report['ready']:
+        print("\n✅ 已就绪，可以接收流量")
+    else:
+        print(f"\n⚠️  查询延迟未达到目标 ({report['latency_target_ms']}ms)，暂不就绪")
+    return report['ready']
+
 def main():
     parser = argparse.ArgumentParser(
         description="AI音乐推荐系统 - 基于用户听歌历史生成个性化推荐",
@@ -125,6 +182,7 @@ def main():
   python cli.py --history-size 8 --recommendations 10
   python cli.py --history-size 5 --recommendations 15 --save-json
   python cli.py --history-size 10 --recommendations 20 --export-txt
+  python cli.py --similarity-backend tfidf warmup --latency-target-ms 50
         """
     )
     
@@ -142,6 +200,158 @@ def main():
         help='推荐歌曲数量 (默认: 10)'
     )
     
+    parser.add_argument(
+        '--mood',
+        action='append',
+        help='只推荐指定情绪的歌曲，可重复指定'
+    )
+    
+    parser.add_argument(
+        '--genre',
+        action='append',
+        help='只推荐指定流派的歌曲，可重复指定'
+    )
+    
+    parser.add_argument(
+        '--year-from',
+        type=int,
+        default=None,
+        help='只推荐该年份及之后的歌曲'
+    )
+    
+    parser.add_argument(
+        '--year-to',
+        type=int,
+        default=None,
+        help='只推荐该年份及之前的歌曲'
+    )
+    
+    parser.add_argument(
+        '--similarity-mode',
+        choices=SIMILARITY_MODES,
+        default='profile',
+        help='相似度推荐模式: profile=用户画像向量检索, neighbors=预计算近邻表聚合 (默认: profile)'
+    )
+    
+    parser.add_argument(
+        '--similarity-backend',
+        choices=SIMILARITY_BACKENDS,
+        default='embedding',
+        help='profile 模式的检索后端: embedding=句子嵌入模型, tfidf=稀疏TF-IDF，无需模型 (默认: embedding)'
+    )
+    
+    parser.add_argument(
+        '--generators',
+        nargs='+',
+        choices=CANDIDATE_GENERATORS,
+        default=['similarity', 'preference'],
+        help='参与合并的候选生成器 (默认: similarity preference)'
+    )
+    
+    parser.add_argument(
+        '--merge-strategy',
+        choices=MERGE_STRATEGIES,
+        default='chain',
+        help='候选合并策略: chain=依次拼接, interleave=轮流交错, score=按归一化分数归并 (默认: chain)'
+    )
+    
+    parser.add_argument(
+        '--diversity',
+        type=float,
+        default=0.0,
+        help='多样性重排权重(0~1)，0表示不做MMR重排 (默认: 0)'
+    )
+    
+    parser.add_argument(
+        '--artist-cap',
+        type=int,
+        default=None,
+        help='每位歌手最多推荐的歌曲数 (默认: 不限)'
+    )
+    
+    parser.add_argument(
+        '--diversity-pool',
+        type=int,
+        default=50,
+        help='多样性重排的候选池大小 (默认: 50)'
+    )
+    
+    parser.add_argument(
+        '--neighbor-table',
+        type=str,
+        default=DEFAULT_NEIGHBOR_TABLE_PATH,
+        help=f'近邻表文件，neighbors 模式使用 (默认: {DEFAULT_NEIGHBOR_TABLE_PATH})'
+    )
+    
+    parser.add_argument(
+        '--embed-batch-size',
+        type=int,
+        default=64,
+        help='曲库编码批大小 (默认: 64)'
+    )
+    
+    parser.add_argument(
+        '--embed-threads',
+        type=int,
+        default=None,
+        help='曲库编码的torch线程数 (默认: 自动)'
+    )
+    
+    parser.add_argument(
+        '--embed-workers',
+        type=int,
+        default=1,
+        help='曲库编码进程数，大曲库可并行编码 (默认: 1)'
+    )
+    
+    parser.add_argument(
+        '--index-path',
+        type=str,
+        default=None,
+        help='磁盘向量索引文件，以只读内存映射方式打开 (由 vector_index.py 生成)'
+    )
+    
+    parser.add_argument(
+        '--nprobe',
+        type=int,
+        default=8,
+        help='磁盘索引检索的倒排桶数量 (默认: 8)'
+    )
+    
+    parser.add_argument(
+        '--rankings',
+        type=str,
+        default=None,
+        help='预计算的热门榜单文件，用于冷启动推荐 (由 popularity_rankings.py 生成)'
+    )
+    
+    parser.add_argument(
+        '--rankings-refresh-interval',
+        type=float,
+        default=3600.0,
+        help='进程内构建的热门榜单的后台重建间隔(秒)，0表示不重建；--rankings 加载的榜单不按时间重建 (默认: 3600)'
+    )
+    
+    parser.add_argument(
+        '--history-store',
+        type=str,
+        default=None,
+        help='听歌历史存储目录，按 --user-id 读取持久化历史（为空时生成并写入）'
+    )
+    
+    parser.add_argument(
+        '--database',
+        type=str,
+        default=None,
+        help='曲库文件 (默认: 使用内置曲库)'
+    )
+    
+    parser.add_argument(
+        '--compact-catalog',
+        action='store_true',
+        help='以紧凑歌曲记录加载 --database 指定的曲库以降低内存占用'
+    )
+    
     parser.add_argument(
         '--save-json',
         action='store_true',
@@ -154,6 +364,19 @@ def main():
         help='导出歌单到文本文件'
     )
     
+    parser.add_argument(
+        '--export-parquet',
+        action='store_true',
+        help='导出推荐结果到Parquet文件（列式，便于批量分析）'
+    )
+    
+    parser.add_argument(
+        '--user-id',
+        type=str,
+        default='demo_user',
+        help='用户ID，用于历史存储和导出结果 (默认: demo_user)'
+    )
+    
     parser.add_argument(
         '--output-prefix',
         type=str,
@@ -167,7 +390,27 @@ def main():
         help='显示详细信息'
     )
     
+    subparsers = parser.add_subparsers(dest='command')
+    warmup_parser = subparsers.add_parser('warmup', help='预热推荐器并报告就绪状态（就绪时退出码为0）')
+    warmup_parser.add_argument(
+        '--queries',
+        type=int,
+        default=3,
+        help='带历史的合成预热查询次数，另加一次冷启动查询 (默认: 3)'
+    )
+    warmup_parser.add_argument(
+        '--latency-target-ms',
+        type=float,
+        default=None,
+        help='就绪所需的查询延迟上限（毫秒）'
+    )
+    
     args = parser.parse_args()
+    if args.compact_catalog and not args.database:
+        parser.error("--compact-catalog 需要配合 --database 使用")
+    
+    if args.command == 'warmup':
+        sys.exit(0 if run_warm_up(args) else 1)
     
     # 打印横幅
     print_banner()
@@ -175,18 +418,33 @@ def main():
     try:
         # 初始化推荐器
         print("🚀 初始化音乐推荐系统...")
-        recommender = MusicRecommender()
+        history_store = ListenHistoryStore(args.history_store) if args.history_store else None
+        recommender = build_recommender(args, history_store)
         
         # 生成用户历史
-        print(f"📝 生成用户听歌历史 ({args.history_size}首歌曲)...")
-        user_history = generate_user_history(args.history_size)
+        user_history = []
+        if history_store is not None:
+            print(f"📂 读取用户 {args.user_id} 的听歌历史...")
+            user_history = recommender.get_user_history(args.user_id, args.history_size)
+        if not user_history:
+            print(f"📝 生成用户听歌历史 ({args.history_size}首歌曲)...")
+            user_history = generate_user_history(args.history_size)
+            if history_store is not None:
+                for song in user_history:
+                    recommender.record_listen(args.user_id, song)
+                history_store.flush()
         
         # 显示用户历史
         display_user_history(user_history)
         
         # 获取推荐
         print(f"\n🎯 分析用户偏好并生成推荐 ({args.recommendations}首歌曲)...")
-        recommendations = recommender.get_recommendations(user_history, args.recommendations)
+        filters = {
+            'mood': args.mood,
+            'genre': args.genre,
+            'year_range': (args.year_from, args.year_to)
+        }
+        recommendations = recommender.get_recommendations(user_history, args.recommendations, filters)
         
         # 显示偏好分析
         display_preferences(recommendations['user_preferences'])
@@ -203,14 +461,22 @@ def main():
             txt_filename = f"{args.output_prefix}.txt"
             export_playlist_to_txt(recommendations, txt_filename)
         
+        if args.export_parquet:
+            parquet_filename = f"{args.output_prefix}.parquet"
+            export_recommendations_to_parquet(recommendations, args.user_id, parquet_filename)
+        
         # 显示详细信息
         if args.verbose:
             print("\n🔍 详细信息:")
             print("=" * 60)
             print(f"音乐数据库大小: {len(recommender.music_data)}首歌曲")
             print(f"用户历史歌曲: {len(user_history)}首")
-            print(f"推荐算法: 相似度匹配 + 偏好分析")
+            print(f"推荐算法: 相似度匹配({args.similarity_mode}/{args.similarity_backend}) + 偏好分析")
             print(f"推荐结果: {len(recommendations['recommendations'])}首歌曲")
+            if recommender.index_build_stats:
+                stats = recommender.index_build_stats
+                print(f"曲库编码: {stats['num_songs']}首, {stats['seconds']:.1f}秒, {stats['songs_per_sec']:.1f}首/秒 "
+                      f"(批大小 {stats['batch_size']}, 进程 {stats['num_workers']})")
         
         print("\n✅ 推荐完成！")
         
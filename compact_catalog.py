@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+紧凑歌曲记录 - 使用 __slots__ 和字符串驻留降低曲库内存占用
+
+每首歌用一个 SongRecord 代替 dict：没有逐实例的 __dict__ 哈希表，
+流派、情绪、节奏、主题、艺术家等重复取值的字符串经 sys.intern 驻留后全库共享，
+相同的标签组合共享同一个元组，年份等整数同样共享。SongRecord 实现了只读 Mapping
+接口，song['title']、song.get(...)、dict(song) 等现有用法保持不变。
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections.abc import Mapping
+from typing import List, Dict, Iterable, Tuple
+
+SONG_FIELDS = ("title", "artist", "genre", "mood", "tempo", "lyrics_theme", "year", "popularity", "tags")
+
+class SongRecord(Mapping):
+    """只读的紧凑歌曲记录，支持 dict 风格的字段访问"""
+
+    __slots__ = SONG_FIELDS
+
+    def __init__(self, title: str, artist: str, genre: str, mood: str, tempo: str,
+                 lyrics_theme: str, year: int, popularity: int, tags: Tuple[str, ...]):
+        self.title = title
+        self.artist = artist
+        self.genre = genre
+        self.mood = mood
+        self.tempo = tempo
+        self.lyrics_theme = lyrics_theme
+        self.year = year
+        self.popularity = popularity
+        self.tags = tags
+
+    def __getitem__(self, key: str):
+        if key not in SONG_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(SONG_FIELDS)
+
+    def __len__(self) -> int:
+        return len(SONG_FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, SongRecord):
+            return all(getattr(self, f) == getattr(other, f) for f in SONG_FIELDS)
+        if isinstance(other, Mapping):
+            return all(other.get(f) == (list(self.tags) if f == "tags" else getattr(self, f))
+                       for f in SONG_FIELDS) and len(other) == len(SONG_FIELDS)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"SongRecord({self.title!r} by {self.artist!r})"
+
+    def to_dict(self) -> Dict:
+        """转换为普通 dict（标签为列表），用于JSON序列化"""
+        song = {f: getattr(self, f) for f in SONG_FIELDS}
+        song["tags"] = list(self.tags)
+        return song
+
+class CatalogInterner:
+    """曲库级别的取值驻留池：字符串、整数和标签元组"""
+
+    def __init__(self):
+        self._ints = {}
+        self._tag_tuples = {}
+
+    def string(self, value: str) -> str:
+        return sys.intern(value)
+
+    def integer(self, value: int) -> int:
+        return self._ints.setdefault(value, value)
+
+    def tags(self, tags: Iterable[str]) -> Tuple[str, ...]:
+        key = tuple(sys.intern(tag) for tag in tags)
+        return self._tag_tuples.setdefault(key, key)
+
+    def record(self, song: Dict) -> SongRecord:
+        return SongRecord(
+            title=song["title"],
+            artist=self.string(song["artist"]),
+            genre=self.string(song["genre"]),
+            mood=self.string(song["mood"]),
+            tempo=self.string(song["tempo"]),
+            lyrics_theme=self.string(song["lyrics_theme"]),
+            year=self.integer(song["year"]),
+            popularity=self.integer(song["popularity"]),
+            tags=self.tags(song["tags"]),
+        )
+
+def compact_music_data(music_data: Iterable[Dict]) -> List[SongRecord]:
+    """把 dict 形式的曲库转换为紧凑记录列表"""
+    interner = CatalogInterner()
+    return [interner.record(song) for song in music_data]
+
+def measure_bytes_per_song(num_songs: int = 1_000_000, seed: int = 42) -> Dict:
+    """在合成曲库上测量 dict 记录与紧凑记录的每首歌内存占用（字节）"""
+    from music_data import generate_synthetic_catalog
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    catalog = generate_synthetic_catalog(num_songs, seed)
+    dict_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    compact = compact_music_data(catalog)
+    del catalog
+    gc.collect()
+    compact_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return {
+        "num_songs": len(compact),
+        "dict_bytes_per_song": dict_bytes / len(compact),
+        "compact_bytes_per_song": compact_bytes / len(compact),
+        "reduction": 1 - compact_bytes / dict_bytes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="测量紧凑歌曲记录的内存占用")
+    parser.add_argument('--songs', type=int, default=1_000_000, help='合成曲库大小 (默认: 1000000)')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子 (默认: 42)')
+    args = parser.parse_args()
+
+    print(f"📏 在 {args.songs} 首歌的合成曲库上测量内存...")
+    result = measure_bytes_per_song(args.songs, args.seed)
+    print(f"  dict 记录: {result['dict_bytes_per_song']:.0f} 字节/首")
+    print(f"  紧凑记录: {result['compact_bytes_per_song']:.0f} 字节/首")
+    print(f"  节省: {result['reduction']:.0%}")
+
+if __name__ == "__main__":
+    main()
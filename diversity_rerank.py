@@ -0,0 +1,76 @@
+"""
+多样性重排 - 对合并后的候选池做最大边际相关（MMR）重排，并限制每位歌手的歌曲数
+
+候选池是合并候选流（见 candidate_merge）的前 pool_size 首，按合并顺序给出相关度：
+第一名为1，最后一名为0，线性递减，这样不同候选生成器量纲不同的分数也能一起比较。
+每一步选出 (1 - diversity) × 相关度 - diversity × 与已选歌曲的最大相似度 最高的候选，
+与已选歌曲的最大相似度在每选出一首后用一次矩阵-向量乘法增量更新，
+整个重排是对候选向量矩阵的k次NumPy运算，代价 O(k·pool)，不调用模型。
+
+artist_cap 限制每位歌手最多入选的歌曲数；候选池中满足上限的歌曲不足时，再按同样的得分用超限歌曲补足。
+没有候选向量时（例如未加载向量索引的 neighbors 模式）不计算相似度，只按相关度和歌手上限选取。
+"""
+
+from typing import List, Dict, Optional, Sequence
+import numpy as np
+
+def mmr_rerank(vectors: Optional[np.ndarray], k: int, diversity: float = 0.3,
+               artists: Optional[Sequence[str]] = None,
+               artist_cap: Optional[int] = None) -> List[int]:
+    """对按相关度排好序的候选做MMR重排，返回入选候选在池中的下标（按入选顺序）
+
+    vectors 为候选池的归一化向量矩阵（第i行对应合并顺序第i名的候选）；为None时只按相关度和歌手上限选取，
+    此时需要提供 artists。
+    """
+    if not 0.0 <= diversity <= 1.0:
+        raise ValueError(f"多样性权重必须在0到1之间: {diversity}")
+    if artist_cap is not None and artist_cap < 1:
+        raise ValueError(f"每位歌手的歌曲上限必须大于0: {artist_cap}")
+
+    if vectors is None and artists is None:
+        raise ValueError("没有候选向量时需要提供歌手列表")
+    pool_size = len(vectors) if vectors is not None else len(artists)
+    k = min(k, pool_size)
+    if k <= 0:
+        return []
+
+    if vectors is not None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+    relevance = np.linspace(1.0, 0.0, pool_size, dtype=np.float32) if pool_size > 1 else np.ones(1, dtype=np.float32)
+    max_similarity = np.zeros(pool_size, dtype=np.float32)
+    available = np.ones(pool_size, dtype=bool)
+
+    # 把歌手映射为整数编号，按编号计数入选次数
+    if artist_cap is not None and artists is not None:
+        _, artist_codes = np.unique(np.asarray(artists, dtype=object), return_inverse=True)
+        artist_counts = np.zeros(artist_codes.max() + 1, dtype=np.int32)
+    else:
+        artist_codes = None
+
+    selected = []
+    while len(selected) < k:
+        scores = (1.0 - diversity) * relevance - diversity * max_similarity
+        scores[~available] = -np.inf
+        if artist_codes is not None:
+            capped = available & (artist_counts[artist_codes] >= artist_cap)
+            # 还有未超限的候选时跳过超限歌手，否则允许超限补足
+            if (available & ~capped).any():
+                scores[capped] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        if artist_codes is not None:
+            artist_counts[artist_codes[best]] += 1
+        if vectors is not None:
+            np.maximum(max_similarity, vectors @ vectors[best], out=max_similarity)
+
+    return selected
+
+def diversify_candidates(candidates: List[tuple], vectors: Optional[np.ndarray], music_data: List[Dict],
+                         k: int, diversity: float = 0.3,
+                         artist_cap: Optional[int] = None) -> List[tuple]:
+    """对 (歌曲ID, 分数, 来源) 候选池做多样性重排，返回入选的k个候选"""
+    artists = [music_data[candidate[0]]['artist'] for candidate in candidates]
+    order = mmr_rerank(vectors, k, diversity, artists, artist_cap)
+    return [candidates[i] for i in order]
@@ -0,0 +1,264 @@
+"""
+用户听歌历史存储 - 分段追加日志 + 内存中的最近历史索引
+
+每条听歌事件以一行 "user_id\tsong_id\ttimestamp" 追加到当前日志分段；分段超过
+segment_max_bytes 后封存并开启新分段，封存分段累积到 compact_threshold 个时在后台线程合并为
+一个覆盖该范围的分段（按用户只保留最近 retain_per_user 条，默认与 recent_limit 相同），合并期间追加不受阻塞。
+重新打开存储时继续写入上次未写满的分段，不会每次打开都产生新文件。内存中为每个用户
+保留最近 recent_limit 次播放，读取最近N次播放只需 O(N)，无需扫描日志。
+"""
+
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+_SEGMENT_PATTERN = re.compile(r"^segment-(\d{8})(?:-(\d{8}))?\.log$")
+_TMP_SEGMENT_PATTERN = re.compile(r"^segment-\d{8}(?:-\d{8})?\.log\.tmp$")
+
+def _segment_name(first: int, last: Optional[int] = None) -> str:
+    if last is None or last == first:
+        return f"segment-{first:08d}.log"
+    return f"segment-{first:08d}-{last:08d}.log"
+
+class ListenHistoryStore:
+    """按用户ID组织的本地听歌历史存储
+
+    retain_per_user 为合并时每个用户保留的最近事件数：默认与 recent_limit 相同，重新打开时只需重放这些事件；
+    为0时合并只拼接分段，保留全部事件。
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024,
+                 recent_limit: int = 200, compact_threshold: int = 8,
+                 retain_per_user: Optional[int] = None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.recent_limit = recent_limit
+        self.compact_threshold = compact_threshold
+        if retain_per_user is None:
+            retain_per_user = recent_limit
+        self.retain_per_user = retain_per_user or None
+
+        self._lock = threading.Lock()
+        # 同一时间只进行一次合并；合并的文件读写不持有 _lock
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.recent_limit))
+        os.makedirs(directory, exist_ok=True)
+
+        self._sealed = self._load_segments()
+        last_first, last = self._sealed[-1] if self._sealed else (0, 0)
+        path = os.path.join(directory, _segment_name(last_first, last))
+        if self._sealed and last_first == last and os.path.getsize(path) < segment_max_bytes:
+            # 上次的活动分段未写满，继续追加
+            self._sealed.pop()
+            self._active_number = last
+        else:
+            self._active_number = last + 1
+        path = os.path.join(directory, _segment_name(self._active_number))
+        # 崩溃时可能留下写了一半的行，先补上换行，避免与新写入的行粘连
+        torn = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._active = open(path, "a", encoding="utf-8")
+        if torn:
+            self._active.write("\n")
+        self._active_bytes = self._active.tell()
+
+        with self._lock:
+            self._maybe_compact()
+
+    def _load_segments(self) -> List[Tuple[int, int]]:
+        """扫描日志目录并重放事件，返回已封存分段的 (起始编号, 结束编号) 列表"""
+        ranges = []
+        for name in os.listdir(self.directory):
+            if _TMP_SEGMENT_PATTERN.match(name):
+                # 合并中断时留下的临时文件，原分段仍完整
+                os.remove(os.path.join(self.directory, name))
+                continue
+            match = _SEGMENT_PATTERN.match(name)
+            if match:
+                first = int(match.group(1))
+                last = int(match.group(2) or first)
+                ranges.append((first, last))
+
+        # 合并中断时可能同时留有合并分段和原分段，以覆盖范围最大的为准
+        ranges.sort(key=lambda r: (r[0], -r[1]))
+        segments = []
+        covered = 0
+        for first, last in ranges:
+            if last <= covered:
+                os.remove(os.path.join(self.directory, _segment_name(first, last)))
+                continue
+            segments.append((first, last))
+            covered = last
+
+        for first, last in segments:
+            self._replay(os.path.join(self.directory, _segment_name(first, last)))
+        return segments
+
+    def _replay(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    # 忽略崩溃时写了一半的行
+                    continue
+                user_id, song_id, timestamp = parts
+                self._recent[user_id].append((int(song_id), float(timestamp)))
+
+    @staticmethod
+    def _check_user_id(user_id: str):
+        # 日志以制表符和换行分隔字段，包含这些字符的ID会破坏日志，重放时被丢弃
+        if any(c in user_id for c in "\t\n\r"):
+            raise ValueError(f"用户ID不能包含制表符或换行符: {user_id!r}")
+
+    def append(self, user_id: str, song_id: int, timestamp: Optional[float] = None):
+        """追加一条听歌事件"""
+        self._check_user_id(user_id)
+        if timestamp is None:
+            timestamp = time.time()
+        line = f"{user_id}\t{song_id}\t{timestamp:.3f}\n"
+        with self._lock:
+            self._active.write(line)
+            self._active_bytes += len(line.encode("utf-8"))
+            self._recent[user_id].append((song_id, timestamp))
+            if self._active_bytes >= self.segment_max_bytes:
+                self._roll_segment()
+
+    def append_many(self, events: List[Tuple[str, int, float]]):
+        """批量追加 (user_id, song_id, timestamp) 事件；有非法用户ID时整批不写入"""
+        for user_id, _, _ in events:
+            self._check_user_id(user_id)
+        with self._lock:
+            for user_id, song_id, timestamp in events:
+                line = f"{user_id}\t{song_id}\t{timestamp:.3f}\n"
+                self._active.write(line)
+                self._active_bytes += len(line.encode("utf-8"))
+                self._recent[user_id].append((song_id, timestamp))
+            if self._active_bytes >= self.segment_max_bytes:
+                self._roll_segment()
+
+    def recent(self, user_id: str, n: int = 20) -> List[Tuple[int, float]]:
+        """返回用户最近n次播放 (song_id, timestamp)，按时间先后排列
+
+        n 最多为 recent_limit。
+        """
+        with self._lock:
+            history = self._recent.get(user_id)
+            if not history:
+                return []
+            latest = list(islice(reversed(history), n))
+        latest.reverse()
+        return latest
+
+    def recent_song_ids(self, user_id: str, n: int = 20) -> List[int]:
+        """返回用户最近n次播放的歌曲ID"""
+        return [song_id for song_id, _ in self.recent(user_id, n)]
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return list(self._recent.keys())
+
+    def _roll_segment(self):
+        """封存当前分段并开启新分段（调用方持有锁）"""
+        self._active.close()
+        self._sealed.append((self._active_number, self._active_number))
+        self._active_number += 1
+        self._active = open(os.path.join(self.directory, _segment_name(self._active_number)), "a", encoding="utf-8")
+        self._active_bytes = 0
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """封存分段达到阈值时启动后台合并（调用方持有锁）"""
+        if len(self._sealed) >= self.compact_threshold and self._compaction_thread is None:
+            self._compaction_thread = threading.Thread(target=self._background_compact, daemon=True)
+            self._compaction_thread.start()
+
+    def _background_compact(self):
+        try:
+            self._compact_sealed()
+        finally:
+            with self._lock:
+                self._compaction_thread = None
+
+    def compact(self):
+        """封存当前分段并合并所有已封存分段，在调用线程中完成"""
+        with self._lock:
+            if self._active_bytes:
+                self._roll_segment()
+        self._compact_sealed()
+
+    def _compact_sealed(self):
+        """把当前已封存的分段合并为一个分段
+
+        只在取快照和替换分段列表时持有追加锁；合并期间新封存的分段排在后面，留待下次合并。
+        """
+        with self._compaction_lock:
+            with self._lock:
+                segments = list(self._sealed)
+            if len(segments) < 2:
+                return
+            self._merge_segments(segments)
+
+    def _merge_segments(self, segments: List[Tuple[int, int]]):
+        first = segments[0][0]
+        last = segments[-1][1]
+        paths = [os.path.join(self.directory, _segment_name(a, b)) for a, b in segments]
+
+        if self.retain_per_user is None:
+            def lines():
+                for path in paths:
+                    with open(path, "r", encoding="utf-8") as f:
+                        yield from f
+        else:
+            kept: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.retain_per_user))
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        kept[line.split("\t", 1)[0]].append(line)
+
+            def lines():
+                for user_lines in kept.values():
+                    yield from user_lines
+
+        target = os.path.join(self.directory, _segment_name(first, last))
+        tmp_path = target + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for line in lines():
+                if line.endswith("\n"):
+                    out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, target)
+
+        with self._lock:
+            self._sealed = [(first, last)] + self._sealed[len(segments):]
+        for path in paths:
+            if path != target and os.path.exists(path):
+                os.remove(path)
+
+    def flush(self):
+        """把缓冲的事件写入操作系统"""
+        with self._lock:
+            self._active.flush()
+
+    def close(self):
+        """等待进行中的后台合并完成后关闭当前分段"""
+        with self._lock:
+            thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._active.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,222 @@
+"""
+实时听歌事件接入 - 按用户增量更新画像，只让受影响用户的缓存失效
+
+UserStateCache 为每个用户保存偏好画像（见 user_profile）、已生成的推荐结果和画像查询向量。
+新的播放事件只更新该用户的画像并丢弃该用户的推荐结果和查询向量，其他用户的状态不受影响。
+每个用户带有版本号，失效时加一；生成推荐期间若版本已变化，结果不会写回缓存，避免缓存旧结果。
+接入事件时先把用户标记为处理中再写历史存储，期间从历史存储加载的画像不会写回缓存，避免同一批播放被计入两次。
+
+ListenEventIngestor 在后台线程中从本地队列批量取出事件交给处理函数（通常是
+MusicRecommender.ingest_listens），凑满 batch_size 或等待超过 max_delay 秒即处理一批，
+同一批事件的日志写入和画像更新各只加一次锁。队列满时 submit 阻塞，形成背压。
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Callable, Hashable, Iterable, Optional, Tuple
+import numpy as np
+
+from user_profile import UserProfile
+
+class _UserState:
+    __slots__ = ("profile", "version", "pending", "recommendations", "query_text", "query_embedding")
+
+    def __init__(self):
+        self.profile: Optional[UserProfile] = None
+        self.version = 0
+        # 已写入历史存储、尚未计入画像的事件批次数
+        self.pending = 0
+        self.recommendations: Dict[Hashable, Dict] = {}
+        self.query_text: Optional[str] = None
+        self.query_embedding: Optional[np.ndarray] = None
+
+class UserStateCache:
+    """按用户保存画像、推荐结果和查询向量，超出容量时淘汰最久未访问的用户"""
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, user_id: str) -> _UserState:
+        # 调用方需持有锁
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def version(self, user_id: str) -> int:
+        with self._lock:
+            return self._state(user_id).version
+
+    def profile_snapshot(self, user_id: str) -> Optional[Tuple[List[Dict], Dict, int]]:
+        """返回 (窗口内的听歌历史, 偏好, 版本)，尚未建立画像时返回None"""
+        with self._lock:
+            state = self._state(user_id)
+            if state.profile is None:
+                return None
+            return state.profile.recent_songs(), state.profile.preferences(), state.version
+
+    def set_profile(self, user_id: str, profile: UserProfile, version: int) -> bool:
+        """保存由历史存储加载的画像；期间有新事件（版本已变化或仍在处理）时放弃，返回是否保存"""
+        with self._lock:
+            state = self._state(user_id)
+            if state.version != version or state.pending:
+                return False
+            state.profile = profile
+            return True
+
+    def begin_listens(self, user_ids: Iterable[str]):
+        """在把事件写入历史存储之前调用：标记用户处理中并让其缓存失效"""
+        with self._lock:
+            for user_id in user_ids:
+                state = self._state(user_id)
+                state.pending += 1
+                self._invalidate(state)
+
+    def abort_listens(self, user_ids: Iterable[str]):
+        """写入历史存储失败时撤销 begin_listens 的标记"""
+        with self._lock:
+            for user_id in user_ids:
+                state = self._state(user_id)
+                state.pending -= 1
+                self._invalidate(state)
+
+    def apply_listens(self, user_id: str, songs: List[Dict], window: Optional[int] = None,
+                      create: bool = False):
+        """把新的播放加入用户画像，结束 begin_listens 的标记，并让该用户的推荐结果和查询向量失效
+
+        用户尚未建立画像时，create 为True则以这些播放新建画像，否则留待下次请求时从历史存储加载。
+        """
+        with self._lock:
+            state = self._state(user_id)
+            state.pending = max(0, state.pending - 1)
+            if state.profile is None and create:
+                state.profile = UserProfile(window)
+            if state.profile is not None:
+                state.profile.extend(songs)
+            self._invalidate(state)
+
+    def _invalidate(self, state: _UserState):
+        state.version += 1
+        state.recommendations.clear()
+        state.query_text = None
+        state.query_embedding = None
+
+    def invalidate(self, user_id: str):
+        """让用户的推荐结果和查询向量失效（画像保留）"""
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._invalidate(state)
+
+    def get_recommendations(self, user_id: str, key: Hashable) -> Optional[Dict]:
+        with self._lock:
+            state = self._users.get(user_id)
+            return None if state is None else state.recommendations.get(key)
+
+    def put_recommendations(self, user_id: str, key: Hashable, result: Dict, version: int):
+        """缓存推荐结果；生成期间用户状态已失效时丢弃"""
+        with self._lock:
+            state = self._state(user_id)
+            if state.version == version:
+                state.recommendations[key] = result
+
+    def get_query_embedding(self, user_id: str, text: str) -> Optional[np.ndarray]:
+        """返回与画像文本一致的缓存查询向量"""
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None or state.query_text != text:
+                return None
+            return state.query_embedding
+
+    def put_query_embedding(self, user_id: str, text: str, embedding: np.ndarray, version: int):
+        with self._lock:
+            state = self._state(user_id)
+            if state.version == version:
+                state.query_text = text
+                state.query_embedding = embedding
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+class ListenEventIngestor:
+    """从本地队列批量消费 (user_id, song, timestamp) 听歌事件"""
+
+    def __init__(self, handler: Callable[[List[Tuple[str, Dict, float]]], object],
+                 batch_size: int = 512, max_delay: float = 0.05, max_queue: int = 100000):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error: Optional[BaseException] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ListenEventIngestor":
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, user_id: str, song: Dict, timestamp: Optional[float] = None):
+        """提交一条听歌事件，队列满时阻塞"""
+        self._queue.put((user_id, song, time.time() if timestamp is None else timestamp))
+
+    def _next_batch(self) -> List[Tuple[str, Dict, float]]:
+        try:
+            batch = [self._queue.get(timeout=self.max_delay)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.handler(batch)
+                self.processed += len(batch)
+                self.batches += 1
+            except Exception as e:
+                # 单批失败不影响后续事件
+                self.errors += 1
+                self.last_error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的事件全部处理完"""
+        self._queue.join()
+
+    def stop(self):
+        """处理完队列中剩余的事件后停止后台线程"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
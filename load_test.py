@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+AI音乐推荐系统 - 并发压测工具
+
+以可配置的并发数和请求速率驱动 MusicRecommender.get_recommendations，
+支持进程内直接调用（inprocess）和通过本地HTTP替身服务调用（http）两种模式，
+用合成的用户听歌历史发请求，报告吞吐量、延迟分位数、错误数以及CPU/RSS随时间的变化。
+
+与 app.py 的部署方式一致，所有并发请求共用一个预热过的推荐器实例（索引和嵌入模型只加载一份），
+指定 --index-path 时以内存映射方式打开磁盘索引。指定 --rate 时按固定速率开环发压，延迟从计划发送时刻算起，
+包含排队时间；不指定时各线程收到响应后立即发下一个请求。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Callable, Optional
+import numpy as np
+from tabulate import tabulate
+
+from music_data import get_all_music_data
+from music_recommender import MusicRecommender, SIMILARITY_BACKENDS
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def current_rss_bytes() -> int:
+    """当前进程常驻内存（字节）"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class ResourceSampler(threading.Thread):
+    """后台线程，按固定间隔采样进程CPU占用和RSS"""
+
+    def __init__(self, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples: List[Dict] = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        start = time.perf_counter()
+        last_wall, last_cpu = start, time.process_time()
+        stopped = False
+        # 停止时再采样一次，保证短时压测也至少有一个样本
+        while not stopped:
+            stopped = self._stop_event.wait(self.interval)
+            wall, cpu = time.perf_counter(), time.process_time()
+            self.samples.append({
+                'elapsed_s': wall - start,
+                'cpu_percent': (cpu - last_cpu) / max(wall - last_wall, 1e-9) * 100,
+                'rss_mb': current_rss_bytes() / (1024 * 1024)
+            })
+            last_wall, last_cpu = wall, cpu
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def start_stand_in_service(recommender: MusicRecommender, host: str = "127.0.0.1",
+                           port: int = 0) -> ThreadingHTTPServer:
+    """启动本地HTTP替身服务：POST /recommend {"history": [歌曲ID], "num_recommendations": k}"""
+    music_data = get_all_music_data()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/recommend":
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                history = [music_data[song_id] for song_id in body["history"]]
+                result = recommender.get_recommendations(history, body.get("num_recommendations", 10))
+                payload = json.dumps({'song_ids': [d['song_id'] for d in result['recommendation_details']]}).encode()
+                self.send_response(200)
+            except Exception as e:
+                payload = json.dumps({'error': str(e)}).encode()
+                self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def generate_synthetic_histories(num_histories: int, min_size: int = 3, max_size: int = 15,
+                                 seed: int = 42) -> List[List[int]]:
+    """生成合成的用户听歌历史（曲库歌曲ID列表）"""
+    rng = random.Random(seed)
+    num_songs = len(get_all_music_data())
+    return [rng.sample(range(num_songs), min(rng.randint(min_size, max_size), num_songs))
+            for _ in range(num_histories)]
+
+def run_load_test(send: Callable[[List[int]], None], histories: List[List[int]], concurrency: int,
+                  num_requests: int, rate: Optional[float] = None, sample_interval: float = 1.0) -> Dict:
+    """以给定并发和速率发送 num_requests 个请求，返回压测统计"""
+    latencies = np.zeros(num_requests)
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    counter = iter(range(num_requests))
+
+    sampler = ResourceSampler(sample_interval)
+    sampler.start()
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            scheduled = start + i / rate if rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                send(histories[i % len(histories)])
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                latencies[i] = np.nan
+                continue
+            latencies[i] = time.perf_counter() - scheduled
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    ok = latencies[~np.isnan(latencies)] * 1000
+    percentiles = np.percentile(ok, [50, 90, 95, 99]) if len(ok) else [float('nan')] * 4
+    return {
+        'requests': num_requests,
+        'succeeded': int(len(ok)),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'mean': float(ok.mean()) if len(ok) else float('nan'),
+            'p50': float(percentiles[0]),
+            'p90': float(percentiles[1]),
+            'p95': float(percentiles[2]),
+            'p99': float(percentiles[3]),
+            'max': float(ok.max()) if len(ok) else float('nan'),
+        },
+        'resources': sampler.samples
+    }
+
+def display_report(report: Dict):
+    """显示压测报告"""
+    print("\n📈 压测结果:")
+    print("=" * 60)
+    summary = [
+        ["请求数", report['requests']],
+        ["成功", report['succeeded']],
+        ["错误", sum(report['errors'].values())],
+        ["耗时(s)", f"{report['elapsed_s']:.2f}"],
+        ["吞吐量(req/s)", f"{report['throughput_rps']:.1f}"],
+    ]
+    summary.extend([f"延迟 {name}(ms)", f"{value:.2f}"] for name, value in report['latency_ms'].items())
+    print(tabulate(summary, tablefmt="grid"))
+
+    if report['errors']:
+        print("\n❌ 错误类型:")
+        print(tabulate(list(report['errors'].items()), headers=["类型", "次数"], tablefmt="grid"))
+
+    if report['resources']:
+        print("\n🖥️  资源占用:")
+        rows = [[f"{s['elapsed_s']:.1f}", f"{s['cpu_percent']:.0f}", f"{s['rss_mb']:.1f}"] for s in report['resources']]
+        print(tabulate(rows, headers=["时间(s)", "CPU(%)", "RSS(MB)"], tablefmt="grid"))
+
+def main():
+    parser = argparse.ArgumentParser(description="AI音乐推荐系统 - 并发压测")
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess', help='压测模式 (默认: inprocess)')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发线程数 (默认: 8)')
+    parser.add_argument('--requests', type=int, default=1000, help='请求总数 (默认: 1000)')
+    parser.add_argument('--rate', type=float, default=None, help='目标请求速率(req/s)，不指定则尽可能快')
+    parser.add_argument('--recommendations', type=int, default=10, help='每次推荐歌曲数量 (默认: 10)')
+    parser.add_argument('--histories', type=int, default=200, help='合成用户历史数量 (默认: 200)')
+    parser.add_argument('--similarity-backend', choices=SIMILARITY_BACKENDS, default='embedding',
+                        help='相似度检索后端 (默认: embedding)')
+    parser.add_argument('--index-path', type=str, default=None, help='磁盘向量索引文件，以只读内存映射方式打开')
+    parser.add_argument('--nprobe', type=int, default=8, help='磁盘索引检索的倒排桶数量 (默认: 8)')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='CPU/RSS采样间隔(秒) (默认: 1.0)')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子 (默认: 42)')
+    parser.add_argument('--output', type=str, default=None, help='把完整报告保存为JSON文件')
+    args = parser.parse_args()
+
+    print("🔥 预热推荐器...")
+    recommender = MusicRecommender(similarity_backend=args.similarity_backend, index_path=args.index_path,
+                                   nprobe=args.nprobe)
+    recommender.warm_up(num_queries=1)
+    histories = generate_synthetic_histories(args.histories, seed=args.seed)
+    music_data = get_all_music_data()
+
+    if args.mode == 'inprocess':
+        def send(history_ids):
+            recommender.get_recommendations([music_data[i] for i in history_ids], args.recommendations)
+    else:
+        server = start_stand_in_service(recommender)
+        url = f"http://{server.server_address[0]}:{server.server_address[1]}/recommend"
+
+        def send(history_ids):
+            body = json.dumps({'history': history_ids, 'num_recommendations': args.recommendations}).encode()
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+
+    rate_text = f"{args.rate} req/s" if args.rate else "不限速"
+    print(f"🚀 压测开始: 模式 {args.mode}, 并发 {args.concurrency}, 请求 {args.requests}, 速率 {rate_text}")
+    report = run_load_test(send, histories, args.concurrency, args.requests, args.rate, args.sample_interval)
+    display_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 压测报告已保存到: {args.output}")
+
+    if args.mode == 'http':
+        server.shutdown()
+
+    sys.exit(0 if report['succeeded'] == report['requests'] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -281,9 +281,31 @@ def generate_user_history(num_songs: int = 10) -> List[Dict]:
     """生成用户的听歌历史（难过抑郁风格）"""
     return random.sample(SAD_MUSIC_DATA, min(num_songs, len(SAD_MUSIC_DATA)))
 
+# 全部音乐数据（只拼接一次，调用方不应修改）
+ALL_MUSIC_DATA = SAD_MUSIC_DATA + HAPPY_MUSIC_DATA + ENERGETIC_MUSIC_DATA
+
 def get_all_music_data() -> List[Dict]:
     """获取所有音乐数据"""
-    return SAD_MUSIC_DATA + HAPPY_MUSIC_DATA + ENERGETIC_MUSIC_DATA
+    return ALL_MUSIC_DATA
+
+def generate_synthetic_catalog(num_songs: int, seed: int = 42, chunk_size: int = 10000) -> List[Dict]:
+    """以现有歌曲为模板生成大规模合成曲库，用于测量和压测
+
+    分块序列化再用 json 解析，与 load_music_data_from_file 读入的对象形态一致。
+    """
+    rng = random.Random(seed)
+    catalog = []
+    for start in range(0, num_songs, chunk_size):
+        chunk = []
+        for i in range(start, min(start + chunk_size, num_songs)):
+            song = dict(rng.choice(ALL_MUSIC_DATA))
+            song['title'] = f"{song['title']} #{i}"
+            song['artist'] = f"{song['artist']} {i % 5000}"
+            song['year'] = rng.randint(1960, 2023)
+            song['popularity'] = rng.randint(30, 100)
+            chunk.append(song)
+        catalog.extend(json.loads(json.dumps(chunk)))
+    return catalog
 
 def save_music_data_to_file(filename: str = "music_database.json"):
     """保存音乐数据到文件"""
@@ -291,11 +313,19 @@ def save_music_data_to_file(filename: str = "music_database.json"):
     with open(filename, "w", encoding="utf-8") as f:
         json.dump(all_music, f, ensure_ascii=False, indent=2)
 
-def load_music_data_from_file(filename: str = "music_database.json") -> List[Dict]:
-    """从文件加载音乐数据"""
+def load_music_data_from_file(filename: str = "music_database.json", compact: bool = False) -> List[Dict]:
+    """从文件加载音乐数据
+
+    compact 为True时每首歌在解析时即转换为紧凑记录（见 compact_catalog），不会同时保留整份 dict 曲库。
+    文件不存在时返回内置曲库（内置曲库常驻内存，不做转换）。
+    """
+    object_hook = None
+    if compact:
+        from compact_catalog import CatalogInterner
+        object_hook = CatalogInterner().record
     try:
         with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+            return json.load(f, object_hook=object_hook)
     except FileNotFoundError:
         return get_all_music_data()
 
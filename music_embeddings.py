@@ -0,0 +1,93 @@
+"""
+音乐向量嵌入工具 - 歌曲描述文本与共享的嵌入模型
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from langchain.embeddings import HuggingFaceEmbeddings
+
+# 本地句子嵌入模型路径
+EMBEDDING_MODEL_NAME = r"D:\Embedding\Embedding"
+
+# 曲库编码默认批大小
+DEFAULT_EMBED_BATCH_SIZE = 64
+
+_embedding_model: Optional[HuggingFaceEmbeddings] = None
+
+def song_description(song: Dict) -> str:
+    """生成用于嵌入的歌曲描述文本"""
+    return f"{song['title']} by {song['artist']} - {song['genre']} - {song['mood']} - {song['tempo']} - {song['lyrics_theme']} - {' '.join(song['tags'])}"
+
+def get_embedding_model() -> HuggingFaceEmbeddings:
+    """获取进程内共享的嵌入模型（首次调用时加载）"""
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cpu'}
+        )
+    return _embedding_model
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """按行做L2归一化，使内积等于余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def set_torch_threads(num_threads: Optional[int]):
+    """设置torch算子内线程数，None表示保持默认"""
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+
+def encode_descriptions(descriptions: List[str], batch_size: int = DEFAULT_EMBED_BATCH_SIZE) -> np.ndarray:
+    """按批编码描述文本，返回未归一化的向量矩阵"""
+    model = get_embedding_model()
+    return np.asarray(
+        model.client.encode(descriptions, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True),
+        dtype=np.float32
+    )
+
+def _init_encode_worker(num_threads: Optional[int]):
+    set_torch_threads(num_threads)
+
+def _encode_shard(descriptions: List[str], batch_size: int) -> np.ndarray:
+    return encode_descriptions(descriptions, batch_size)
+
+def encode_music_catalog(music_data: List[Dict], batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+                         num_threads: Optional[int] = None, num_workers: int = 1) -> Tuple[np.ndarray, Dict]:
+    """批量编码整个曲库，返回 (归一化向量矩阵, 编码统计)
+
+    num_workers > 1 时把曲库切成连续分片，由多个进程各自加载模型并编码，
+    再按原顺序拼接各分片的结果；未指定 num_threads 时每个进程平分CPU核数。
+    """
+    start = time.perf_counter()
+    descriptions = [song_description(song) for song in music_data]
+    num_workers = max(1, min(num_workers, len(descriptions)))
+
+    if num_workers == 1:
+        set_torch_threads(num_threads)
+        vectors = encode_descriptions(descriptions, batch_size)
+    else:
+        worker_threads = num_threads or max(1, (os.cpu_count() or 1) // num_workers)
+        shard_size = -(-len(descriptions) // num_workers)
+        shards = [descriptions[i:i + shard_size] for i in range(0, len(descriptions), shard_size)]
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_encode_worker,
+                                 initargs=(worker_threads,)) as executor:
+            parts = list(executor.map(_encode_shard, shards, [batch_size] * len(shards)))
+        vectors = np.concatenate(parts, axis=0)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'num_songs': len(descriptions),
+        'batch_size': batch_size,
+        'num_threads': num_threads,
+        'num_workers': num_workers,
+        'seconds': elapsed,
+        'songs_per_sec': len(descriptions) / elapsed if elapsed > 0 else float('inf'),
+    }
+    return normalize_vectors(vectors), stats
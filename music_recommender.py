@@ -1,185 +1,572 @@
 import json
-import random
-from typing import List, Dict, Optional
+import heapq
+import threading
+import time
+from typing import List, Dict, Callable, Iterator, Optional, Sequence, Tuple
+from itertools import chain, islice
 from collections import Counter
 import numpy as np
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.llms.base import LLM
 from langchain.schema import BaseOutputParser
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.text_splitter import CharacterTextSplitter
 
 from music_data import get_all_music_data, generate_user_history
+from music_embeddings import get_embedding_model, encode_music_catalog, normalize_vectors, DEFAULT_EMBED_BATCH_SIZE
+from neighbor_table import NeighborTable
+from vector_index import build_flat_index, open_mmap_index, ivf_nlist, make_search_params, search_index, reconstruct_vectors, index_memory_bytes
+from catalog_filters import CatalogAttributeIndex, normalize_filters
+from popularity_rankings import PopularityRankings
+from history_store import ListenHistoryStore
+from candidate_merge import merge_candidates, MERGE_STRATEGIES
+from diversity_rerank import diversify_candidates
+from recommendation_session import RecommendationSession, RecommendationSessionCache
+from tfidf_similarity import TfidfSimilarityIndex, profile_terms
+from user_profile import UserProfile, empty_preferences
+from listen_ingestion import UserStateCache, ListenEventIngestor
+
+# 相似度推荐模式
+SIMILARITY_MODES = ("profile", "neighbors")
+
+# 用户画像相似度检索后端：embedding=句子嵌入+FAISS，tfidf=稀疏TF-IDF（无需模型）
+SIMILARITY_BACKENDS = ("embedding", "tfidf")
+
+# 可参与合并的候选生成器
+CANDIDATE_GENERATORS = ("similarity", "preference", "neighbors", "popularity")
+
+class RequestContext:
+    """一次推荐请求的用户历史和偏好，在各候选生成器之间传递而不写入推荐器实例
+
+    同一个推荐器可以被多个线程同时使用；user_id 和 version 仅在按用户ID推荐时设置，用于缓存画像查询向量。
+    """
+    __slots__ = ("user_history", "user_preferences", "user_id", "version")
+
+    def __init__(self, user_history: List[Dict], user_preferences: Dict,
+                 user_id: Optional[str] = None, version: int = 0):
+        self.user_history = user_history
+        self.user_preferences = user_preferences
+        self.user_id = user_id
+        self.version = version
 
 class MusicRecommender:
     """基于LangChain的音乐推荐系统"""
     
-    def __init__(self, music_data: List[Dict] = None):
+    def __init__(self, music_data: List[Dict] = None, similarity_mode: str = "profile",
+                 neighbor_table: Optional[NeighborTable] = None, similarity_backend: str = "embedding",
+                 embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE, embed_threads: Optional[int] = None,
+                 embed_workers: int = 1, index_path: Optional[str] = None, nprobe: int = 8,
+                 history_store: Optional[ListenHistoryStore] = None, max_sessions: int = 1000,
+                 session_idle_timeout: float = 1800.0,
+                 candidate_generators: Sequence[str] = ("similarity", "preference"),
+                 merge_strategy: str = "chain", popularity_rankings: Optional[PopularityRankings] = None,
+                 rankings_refresh_interval: Optional[float] = 3600.0, diversity: float = 0.0,
+                 artist_cap: Optional[int] = None, diversity_pool_size: int = 50,
+                 user_cache_size: int = 10000, profile_window: int = 20):
+        if similarity_mode not in SIMILARITY_MODES:
+            raise ValueError(f"未知的相似度推荐模式: {similarity_mode}")
+        if similarity_backend not in SIMILARITY_BACKENDS:
+            raise ValueError(f"未知的相似度检索后端: {similarity_backend}")
+        for generator in candidate_generators:
+            if generator not in CANDIDATE_GENERATORS:
+                raise ValueError(f"未知的候选生成器: {generator}")
+        if "neighbors" in candidate_generators and neighbor_table is None:
+            raise ValueError("neighbors 候选生成器需要提供预计算的近邻表")
+        if merge_strategy not in MERGE_STRATEGIES:
+            raise ValueError(f"未知的候选合并策略: {merge_strategy}")
+        if similarity_mode == "neighbors" and neighbor_table is None:
+            raise ValueError("neighbors 模式需要提供预计算的近邻表")
+        if not 0.0 <= diversity <= 1.0:
+            raise ValueError(f"多样性权重必须在0到1之间: {diversity}")
+        if artist_cap is not None and artist_cap < 1:
+            raise ValueError(f"每位歌手的歌曲上限必须大于0: {artist_cap}")
+        
         self.music_data = music_data or get_all_music_data()
+        self.similarity_mode = similarity_mode
+        self.neighbor_table = neighbor_table
+        self.similarity_backend = similarity_backend
+        self.embed_batch_size = embed_batch_size
+        self.embed_threads = embed_threads
+        self.embed_workers = embed_workers
+        self.index_path = index_path
+        self.nprobe = nprobe
+        self.history_store = history_store
+        self.sessions = RecommendationSessionCache(max_sessions, session_idle_timeout)
+        self.candidate_generators = tuple(candidate_generators)
+        self.merge_strategy = merge_strategy
+        self.rankings_refresh_interval = rankings_refresh_interval
+        self.diversity = diversity
+        self.artist_cap = artist_cap
+        self.diversity_pool_size = diversity_pool_size
+        self.profile_window = profile_window
+        self.user_states = UserStateCache(user_cache_size)
+        self._popularity_rankings = popularity_rankings
+        # 传入的预计算榜单由离线任务负责更新，不按时间重建
+        self._rankings_preloaded = popularity_rankings is not None
+        self._rankings_refreshing = False
+        self._rankings_lock = threading.Lock()
+        self.ready = False
+        self.warm_up_report = {}
+        self.index_build_stats = {}
         self.user_history = []
         self.user_preferences = {}
+        self._song_ids = None
+        self._tfidf_index = None
+        self._vector_index = None
+        self._attribute_index = None
+        self._index_lock = threading.Lock()
+        # 向量索引或TF-IDF索引加载完成后的回调（例如 CatalogRegistry 据此统计内存占用）
+        self.on_index_loaded: Optional[Callable[["MusicRecommender"], None]] = None
+        
+    def song_id(self, song: Dict) -> Optional[int]:
+        """返回歌曲在曲库中的ID（下标），未收录时返回None"""
+        if self._song_ids is None:
+            # 构建完成后再发布，避免并发请求读到不完整的映射
+            song_ids = {}
+            for i, s in enumerate(self.music_data):
+                song_ids.setdefault(s['title'], i)
+            self._song_ids = song_ids
+        return self._song_ids.get(song['title'])
         
     def analyze_user_history(self, user_history: List[Dict]) -> Dict:
-        """分析用户听歌历史，提取偏好特征"""
-        self.user_history = user_history
+        """分析用户听歌历史，提取偏好特征，并保存为 recommend_by_* 等方法使用的当前用户
+        
+        get_recommendations 等请求入口不读写这些实例属性，可在多线程间共享同一个推荐器；
+        在共享推荐器上直接调用 recommend_by_* 时应传入 create_request_context 创建的请求上下文。
+        """
+        context = self._request_context(user_history)
+        self.user_history, self.user_preferences = context.user_history, context.user_preferences
+        return context.user_preferences or empty_preferences()
+    
+    def summarize_user_history(self, user_history: List[Dict]) -> Dict:
+        """分析用户听歌历史并返回偏好特征，不修改推荐器状态"""
+        return self._request_context(user_history).user_preferences or empty_preferences()
+    
+    def create_request_context(self, user_history: List[Dict]) -> RequestContext:
+        """为 recommend_by_* / *_candidates 创建请求上下文，不修改推荐器状态"""
+        return self._request_context(user_history)
+    
+    def _request_context(self, user_history: List[Dict], user_id: Optional[str] = None,
+                         version: int = 0) -> RequestContext:
+        """分析用户历史得到请求上下文；没有历史时不做画像，推荐走冷启动榜单"""
+        preferences = UserProfile.from_songs(user_history).preferences() if user_history else {}
+        return RequestContext(user_history, preferences, user_id, version)
+    
+    def _context(self, context: Optional[RequestContext]) -> RequestContext:
+        # 未传入请求上下文时使用 analyze_user_history 保存的当前用户
+        return context if context is not None else RequestContext(self.user_history, self.user_preferences)
+    
+    def get_vector_index(self):
+        """获取曲库向量索引（首次调用时打开或构建，之后复用）
+
+        指定 index_path 时以只读内存映射方式打开磁盘索引，多个进程共享页缓存；
+        否则编码曲库并在内存中构建精确内积索引。
+        """
+        index = self._vector_index
+        if index is None:
+            loaded = False
+            # 并发的首次请求只构建一次
+            with self._index_lock:
+                index = self._vector_index
+                if index is None:
+                    if self.index_path:
+                        index = open_mmap_index(self.index_path, self.nprobe, len(self.music_data))
+                    else:
+                        vectors, self.index_build_stats = encode_music_catalog(
+                            self.music_data,
+                            batch_size=self.embed_batch_size,
+                            num_threads=self.embed_threads,
+                            num_workers=self.embed_workers
+                        )
+                        index = build_flat_index(vectors)
+                    self._vector_index = index
+                    loaded = True
+            if loaded and self.on_index_loaded is not None:
+                self.on_index_loaded(self)
+        return index
+    
+    def embed_query(self, text: str):
+        """把查询文本编码为归一化向量"""
+        return normalize_vectors([get_embedding_model().embed_query(text)])[0]
+    
+    def _profile_query_vector(self, context: RequestContext):
+        """用户画像的查询向量，按用户ID推荐时复用该用户缓存的向量"""
+        text = self._create_user_profile(context)
+        if context.user_id is None:
+            return self.embed_query(text)
+        query = self.user_states.get_query_embedding(context.user_id, text)
+        if query is None:
+            query = self.embed_query(text)
+            self.user_states.put_query_embedding(context.user_id, text, query, context.version)
+        return query
+    
+    def get_tfidf_index(self) -> TfidfSimilarityIndex:
+        """获取曲库的稀疏TF-IDF索引（首次调用时构建）"""
+        index = self._tfidf_index
+        if index is None:
+            loaded = False
+            with self._index_lock:
+                index = self._tfidf_index
+                if index is None:
+                    index = self._tfidf_index = TfidfSimilarityIndex.from_music_data(self.music_data)
+                    loaded = True
+            if loaded and self.on_index_loaded is not None:
+                self.on_index_loaded(self)
+        return index
+    
+    def load_index(self):
+        """加载当前相似度模式和后端需要的检索索引（neighbors 模式使用近邻表，不加载）"""
+        if self.similarity_mode != "profile":
+            return
+        if self.similarity_backend == "tfidf":
+            self.get_tfidf_index()
+        else:
+            self.get_vector_index()
+    
+    def index_memory_bytes(self) -> int:
+        """已加载的向量索引和TF-IDF索引占用的字节数（估算）"""
+        total = 0
+        if self._vector_index is not None:
+            total += index_memory_bytes(self._vector_index)
+        if self._tfidf_index is not None:
+            total += self._tfidf_index.memory_bytes()
+        return total
+    
+    def release_indexes(self):
+        """释放已加载的向量索引和TF-IDF索引，下次检索时重新加载
+        
+        分页会话的候选流可能仍引用旧索引，一并丢弃，使索引占用的内存真正得到释放。
+        """
+        self._vector_index = None
+        self._tfidf_index = None
+        self.sessions.clear()
+    
+    def candidate_vectors(self, song_ids: Sequence[int]) -> Optional[np.ndarray]:
+        """取回候选歌曲的归一化向量矩阵：embedding 后端取自向量索引，tfidf 后端取自TF-IDF矩阵的对应行
+        
+        只使用已加载的索引或可直接内存映射打开的磁盘索引，不会为此编码曲库或构建索引
+        （例如 neighbors 模式不加载模型）；没有可用的向量时返回None。
+        """
+        if self.similarity_backend == "tfidf":
+            index = self._tfidf_index
+            return None if index is None else index.matrix[list(song_ids)].toarray()
+        if self._vector_index is None and not self.index_path:
+            return None
+        return reconstruct_vectors(self.get_vector_index(), song_ids)
+    
+    def _diversify(self, candidates: List[Tuple[int, float, str]], num_recommendations: int,
+                   diversity: float, artist_cap: Optional[int]) -> List[Tuple[int, float, str]]:
+        """对候选池做MMR/歌手上限重排（见 diversity_rerank），只用已有向量，不调用模型；没有向量时只限制歌手"""
+        if not candidates:
+            return candidates
+        vectors = self.candidate_vectors([song_id for song_id, score, source in candidates])
+        return diversify_candidates(candidates, vectors, self.music_data, num_recommendations,
+                                    diversity, artist_cap)
+    
+    def _history_ids(self, context: Optional[RequestContext] = None) -> List[int]:
+        """用户历史歌曲在曲库中的ID"""
+        history = self._context(context).user_history
+        return [song_id for song_id in map(self.song_id, history) if song_id is not None]
+    
+    def _to_songs(self, candidates: List[Tuple[int, float]]) -> List[Dict]:
+        return [self.music_data[song_id] for song_id, score in candidates]
+    
+    def get_attribute_index(self) -> CatalogAttributeIndex:
+        """获取曲库属性过滤索引（首次调用时构建）"""
+        if self._attribute_index is None:
+            self._attribute_index = CatalogAttributeIndex(self.music_data)
+        return self._attribute_index
+    
+    def get_popularity_rankings(self) -> PopularityRankings:
+        """获取热门榜单
+        
+        优先使用传入的预计算榜单（不按时间重建）；否则首次调用时由曲库构建（warm_up 会提前完成）。
+        进程内构建的榜单超过刷新间隔后在后台线程重建并整体替换，当前请求继续使用旧榜单，不承担重建开销。
+        """
+        rankings = self._popularity_rankings
+        if rankings is None:
+            with self._rankings_lock:
+                rankings = self._popularity_rankings
+                if rankings is None:
+                    rankings = self._popularity_rankings = PopularityRankings.build(self.music_data)
+        elif (not self._rankings_preloaded and self.rankings_refresh_interval
+              and rankings.is_stale(self.rankings_refresh_interval)):
+            self._refresh_rankings_in_background()
+        return rankings
+    
+    def _refresh_rankings_in_background(self):
+        with self._rankings_lock:
+            if self._rankings_refreshing:
+                return
+            self._rankings_refreshing = True
+        
+        def refresh():
+            try:
+                self._popularity_rankings = PopularityRankings.build(self.music_data)
+            finally:
+                self._rankings_refreshing = False
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def iter_popularity_candidates(self, filters: Optional[Dict] = None,
+                                   context: Optional[RequestContext] = None) -> Iterator[Tuple[int, float]]:
+        """热门榜单候选流，跳过用户听过的歌曲"""
+        allowed_mask = self.get_attribute_index().mask(filters)
+        return self.get_popularity_rankings().iter_top(filters, allowed_mask, self._history_ids(context))
+    
+    def _iter_search(self, search, chunk_size: int = 10,
+                     context: Optional[RequestContext] = None) -> Iterator[Tuple[int, float]]:
+        """把检索函数包装为惰性的候选流，按分数顺序产出标题不重复、未听过的歌曲
+        
+        search(k, exclude_ids, attempt) 返回 (最多k个 (歌曲ID, 分数), 是否已检索全部范围)；每轮把已返回的ID
+        加入排除集合，下一轮只检索新的歌曲，批大小逐轮翻倍，取前N首的摊销代价为 O(N)。
+        某轮返回不足k个时 attempt 加一（IVF索引据此扩大检索范围，直到检索全部倒排桶）；
+        只有在已检索全部范围时结果仍不足，才说明没有更多候选，流结束。
+        """
+        context = self._context(context)
+        excluded = set(self._history_ids(context))
+        seen_titles = {song['title'] for song in context.user_history}
+        
+        def stream():
+            size = chunk_size
+            attempt = 0
+            while True:
+                results, exhausted = search(size, excluded, attempt)
+                for song_id, score in results:
+                    excluded.add(song_id)
+                    title = self.music_data[song_id]['title']
+                    if title not in seen_titles:
+                        seen_titles.add(title)
+                        yield song_id, score
+                if len(results) < size:
+                    if exhausted:
+                        return
+                    attempt += 1
+                size *= 2
+        
+        return stream()
+    
+    def _embedding_search(self, filters: Optional[Dict] = None, context: Optional[RequestContext] = None):
+        """基于向量索引的用户画像检索函数，索引和画像查询向量在第一次检索时才获取"""
+        context = self._context(context)
+        allowed_mask = self.get_attribute_index().mask(filters)
+        index = query = None
+        
+        # 排除项和属性过滤通过ID选择器下推到索引；结果不足时扩大IVF检索范围重试，最多检索全部倒排桶
+        def search(k, exclude_ids, attempt):
+            nonlocal index, query
+            if query is None:
+                # 复用已构建或内存映射的索引，基于用户历史创建查询
+                index = self.get_vector_index()
+                query = self._profile_query_vector(context)
+            nlist = ivf_nlist(index)
+            nprobe = self.nprobe * (4 ** attempt)
+            if nlist is not None:
+                nprobe = min(nprobe, nlist)
+            params, keepalive = make_search_params(index, allowed_mask, exclude_ids, nprobe=nprobe)
+            ids, scores = search_index(index, query, k, params)
+            return list(zip(ids.tolist(), scores.tolist())), nlist is None or nprobe >= nlist
+        
+        return search
+    
+    def _neighbor_search(self, filters: Optional[Dict] = None, context: Optional[RequestContext] = None):
+        """基于近邻表聚合的检索函数"""
+        if self.neighbor_table is None:
+            raise ValueError("未加载近邻表")
         
-        # 统计特征
-        genres = [song['genre'] for song in user_history]
-        moods = [song['mood'] for song in user_history]
-        tempos = [song['tempo'] for song in user_history]
-        themes = [song['lyrics_theme'] for song in user_history]
-        years = [song['year'] for song in user_history]
-        
-        # 计算偏好
-        genre_pref = Counter(genres).most_common(3)
-        mood_pref = Counter(moods).most_common(2)
-        tempo_pref = Counter(tempos).most_common(2)
-        theme_pref = Counter(themes).most_common(3)
-        
-        # 年代偏好
-        avg_year = np.mean(years)
-        year_range = max(years) - min(years)
-        
-        # 流行度偏好
-        avg_popularity = np.mean([song['popularity'] for song in user_history])
-        
-        self.user_preferences = {
-            'favorite_genres': [g[0] for g in genre_pref],
-            'favorite_moods': [m[0] for m in mood_pref],
-            'favorite_tempos': [t[0] for t in tempo_pref],
-            'favorite_themes': [th[0] for th in theme_pref],
-            'average_year': avg_year,
-            'year_range': year_range,
-            'average_popularity': avg_popularity,
-            'total_songs': len(user_history)
-        }
+        history_ids = self._history_ids(context)
+        allowed_mask = self.get_attribute_index().mask(filters)
         
-        return self.user_preferences
-    
-    def create_music_embeddings(self) -> FAISS:
-        """为音乐数据创建向量嵌入"""
-        # 为每首歌创建文本描述
-        music_descriptions = []
-        for song in self.music_data:
-            description = f"{song['title']} by {song['artist']} - {song['genre']} - {song['mood']} - {song['tempo']} - {song['lyrics_theme']} - {' '.join(song['tags'])}"
-            music_descriptions.append(description)
-        
-        # 使用文本分割器
-        text_splitter = CharacterTextSplitter(
-            separator="\n",
-            chunk_size=1000,
-            chunk_overlap=200
-        )
+        def search(k, exclude_ids, attempt):
+            return self.neighbor_table.aggregate(history_ids, k, exclude_ids, allowed_mask), True
         
-        # 创建嵌入
-        embeddings = HuggingFaceEmbeddings(
-            model_name="D:\Embedding\Embedding",
-            model_kwargs={'device': 'cpu'}
-        )
+        return search
+    
+    def _tfidf_search(self, filters: Optional[Dict] = None, context: Optional[RequestContext] = None):
+        """基于稀疏TF-IDF的用户画像检索函数"""
+        context = self._context(context)
+        terms = profile_terms(context.user_preferences, context.user_history[-3:])
+        allowed_mask = self.get_attribute_index().mask(filters)
         
-        # 创建向量存储
-        vectorstore = FAISS.from_texts(music_descriptions, embeddings)
+        def search(k, exclude_ids, attempt):
+            return self.get_tfidf_index().search(terms, k, exclude_ids=exclude_ids, allowed_mask=allowed_mask), True
         
-        return vectorstore
+        return search
     
-    def recommend_by_similarity(self, num_recommendations: int = 10) -> List[Dict]:
+    def _similarity_search(self, filters: Optional[Dict] = None, context: Optional[RequestContext] = None):
+        """按相似度模式和后端选择检索函数"""
+        if self.similarity_mode == "neighbors":
+            return self._neighbor_search(filters, context)
+        if self.similarity_backend == "tfidf":
+            return self._tfidf_search(filters, context)
+        return self._embedding_search(filters, context)
+    
+    def similarity_candidates(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                              context: Optional[RequestContext] = None) -> List[Tuple[int, float]]:
+        """基于相似度的候选，返回按分数排序的 (歌曲ID, 分数) 列表；通常一到两次索引调用即可凑满"""
+        stream = self.iter_similarity_candidates(filters, num_recommendations, context)
+        return list(islice(stream, num_recommendations))
+    
+    def iter_similarity_candidates(self, filters: Optional[Dict] = None, chunk_size: int = 10,
+                                   context: Optional[RequestContext] = None) -> Iterator[Tuple[int, float]]:
+        """基于相似度的惰性候选流"""
+        context = self._context(context)
+        if not context.user_history:
+            return self.iter_popularity_candidates(filters, context)
+        
+        return self._iter_search(self._similarity_search(filters, context), chunk_size, context=context)
+    
+    def recommend_by_similarity(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                                context: Optional[RequestContext] = None) -> List[Dict]:
         """基于相似度推荐"""
-        if not self.user_history:
-            return random.sample(self.music_data, num_recommendations)
-        
-        # 创建向量存储
-        vectorstore = self.create_music_embeddings()
-        
-        # 基于用户历史创建查询
-        user_profile = self._create_user_profile()
-        
-        # 搜索相似歌曲
-        similar_docs = vectorstore.similarity_search(user_profile, k=num_recommendations * 2)
-        
-        # 提取歌曲信息
-        recommended_songs = []
-        seen_titles = set()
-        
-        for doc in similar_docs:
-            # 从文档内容中提取歌曲信息
-            for song in self.music_data:
-                if song['title'] in doc.page_content and song['title'] not in seen_titles:
-                    recommended_songs.append(song)
-                    seen_titles.add(song['title'])
-                    if len(recommended_songs) >= num_recommendations:
-                        break
-            if len(recommended_songs) >= num_recommendations:
-                break
-        
-        return recommended_songs
+        return self._to_songs(self.similarity_candidates(num_recommendations, filters, context))
+    
+    def neighbor_candidates(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                            context: Optional[RequestContext] = None) -> List[Tuple[int, float]]:
+        """聚合用户历史歌曲的近邻得到候选"""
+        context = self._context(context)
+        stream = self._iter_search(self._neighbor_search(filters, context), num_recommendations, context)
+        return list(islice(stream, num_recommendations))
+    
+    def recommend_by_neighbors(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                               context: Optional[RequestContext] = None) -> List[Dict]:
+        """基于预计算近邻表推荐：聚合用户历史歌曲的近邻，不调用嵌入模型"""
+        return self._to_songs(self.neighbor_candidates(num_recommendations, filters, context))
+    
+    def tfidf_candidates(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                         context: Optional[RequestContext] = None) -> List[Tuple[int, float]]:
+        """稀疏TF-IDF用户画像检索得到候选"""
+        context = self._context(context)
+        stream = self._iter_search(self._tfidf_search(filters, context), num_recommendations, context)
+        return list(islice(stream, num_recommendations))
+    
+    def recommend_by_tfidf(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                           context: Optional[RequestContext] = None) -> List[Dict]:
+        """基于稀疏TF-IDF的用户画像相似度推荐，不调用嵌入模型"""
+        return self._to_songs(self.tfidf_candidates(num_recommendations, filters, context))
+    
+    def _preference_score(self, song: Dict, preferences: Optional[Dict] = None) -> int:
+        """计算歌曲与用户偏好的匹配分数"""
+        preferences = self.user_preferences if preferences is None else preferences
+        score = 0
+        
+        # 流派匹配
+        if song['genre'] in preferences['favorite_genres']:
+            score += 3
+        
+        # 情绪匹配
+        if song['mood'] in preferences['favorite_moods']:
+            score += 2
+        
+        # 节奏匹配
+        if song['tempo'] in preferences['favorite_tempos']:
+            score += 2
+        
+        # 主题匹配
+        if song['lyrics_theme'] in preferences['favorite_themes']:
+            score += 2
+        
+        # 年代匹配（越接近用户偏好的年代分数越高）
+        year_diff = abs(song['year'] - preferences['average_year'])
+        if year_diff <= 5:
+            score += 2
+        elif year_diff <= 10:
+            score += 1
+        
+        # 流行度匹配
+        pop_diff = abs(song['popularity'] - preferences['average_popularity'])
+        if pop_diff <= 10:
+            score += 1
+        
+        return score
+    
+    def preference_candidates(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                              context: Optional[RequestContext] = None) -> List[Tuple[int, float]]:
+        """基于用户偏好的候选，返回按分数排序的 (歌曲ID, 分数) 列表，同分时按曲库顺序"""
+        return list(islice(self.iter_preference_candidates(filters, context), num_recommendations))
+    
+    def iter_preference_candidates(self, filters: Optional[Dict] = None,
+                                   context: Optional[RequestContext] = None) -> Iterator[Tuple[int, float]]:
+        """基于用户偏好的惰性候选流：第一次拉取时全曲库评分并建堆，之后按需弹出，取前k首为 O(n + k·log n)"""
+        context = self._context(context)
+        preferences = context.user_preferences
+        if not preferences:
+            return self.iter_popularity_candidates(filters, context)
+        
+        history_ids = set(self._history_ids(context))
+        allowed_mask = self.get_attribute_index().mask(filters)
+        
+        def stream():
+            # 同分时按曲库顺序
+            heap = [
+                (-self._preference_score(song, preferences), song_id)
+                for song_id, song in enumerate(self.music_data)
+                if song_id not in history_ids and (allowed_mask is None or allowed_mask[song_id])
+            ]
+            heapq.heapify(heap)
+            while heap:
+                neg_score, song_id = heapq.heappop(heap)
+                yield song_id, float(-neg_score)
+        
+        return stream()
+    
+    def iter_neighbor_candidates(self, filters: Optional[Dict] = None, chunk_size: int = 10,
+                                 context: Optional[RequestContext] = None) -> Iterator[Tuple[int, float]]:
+        """基于近邻表的惰性候选流"""
+        context = self._context(context)
+        if not context.user_history:
+            return iter(())
+        return self._iter_search(self._neighbor_search(filters, context), chunk_size, context=context)
+    
+    def candidate_streams(self, filters: Optional[Dict] = None, chunk_size: int = 10,
+                          context: Optional[RequestContext] = None) -> List[Tuple[str, Iterator[Tuple[int, float]]]]:
+        """按配置的候选生成器建立惰性候选流，实际检索在合并阶段拉取时才发生
+        
+        没有用户历史时相似度和偏好生成器退化为热门榜单，这些候选的来源记为 popularity，且只建立一条热门榜单流。
+        """
+        context = self._context(context)
+        factories = {
+            'similarity': lambda: self.iter_similarity_candidates(filters, chunk_size, context),
+            'preference': lambda: self.iter_preference_candidates(filters, context),
+            'neighbors': lambda: self.iter_neighbor_candidates(filters, chunk_size, context),
+            'popularity': lambda: self.iter_popularity_candidates(filters, context),
+        }
+        fallback = {
+            'similarity': not context.user_history,
+            'preference': not context.user_preferences,
+        }
+        streams = []
+        for name in self.candidate_generators:
+            if fallback.get(name):
+                name = 'popularity'
+            if name not in (stream_name for stream_name, _ in streams):
+                streams.append((name, factories[name]()))
+        return streams
     
-    def recommend_by_preferences(self, num_recommendations: int = 10) -> List[Dict]:
+    def recommend_by_preferences(self, num_recommendations: int = 10, filters: Optional[Dict] = None,
+                                 context: Optional[RequestContext] = None) -> List[Dict]:
         """基于用户偏好推荐"""
-        if not self.user_preferences:
-            return random.sample(self.music_data, num_recommendations)
-        
-        # 计算每首歌的匹配分数
-        song_scores = []
-        
-        for song in self.music_data:
-            score = 0
-            
-            # 流派匹配
-            if song['genre'] in self.user_preferences['favorite_genres']:
-                score += 3
-            
-            # 情绪匹配
-            if song['mood'] in self.user_preferences['favorite_moods']:
-                score += 2
-            
-            # 节奏匹配
-            if song['tempo'] in self.user_preferences['favorite_tempos']:
-                score += 2
-            
-            # 主题匹配
-            if song['lyrics_theme'] in self.user_preferences['favorite_themes']:
-                score += 2
-            
-            # 年代匹配（越接近用户偏好的年代分数越高）
-            year_diff = abs(song['year'] - self.user_preferences['average_year'])
-            if year_diff <= 5:
-                score += 2
-            elif year_diff <= 10:
-                score += 1
-            
-            # 流行度匹配
-            pop_diff = abs(song['popularity'] - self.user_preferences['average_popularity'])
-            if pop_diff <= 10:
-                score += 1
-            
-            # 避免推荐用户已经听过的歌
-            if song not in self.user_history:
-                song_scores.append((song, score))
-        
-        # 按分数排序并返回推荐
-        song_scores.sort(key=lambda x: x[1], reverse=True)
-        return [song for song, score in song_scores[:num_recommendations]]
-    
-    def _create_user_profile(self) -> str:
+        return self._to_songs(self.preference_candidates(num_recommendations, filters, context))
+    
+    def _create_user_profile(self, context: Optional[RequestContext] = None) -> str:
         """创建用户画像文本"""
-        if not self.user_preferences:
+        context = self._context(context)
+        preferences = context.user_preferences
+        if not preferences:
             return ""
         
         profile_parts = []
         
-        if self.user_preferences['favorite_genres']:
-            profile_parts.append(f"Genres: {', '.join(self.user_preferences['favorite_genres'])}")
+        if preferences['favorite_genres']:
+            profile_parts.append(f"Genres: {', '.join(preferences['favorite_genres'])}")
         
-        if self.user_preferences['favorite_moods']:
-            profile_parts.append(f"Moods: {', '.join(self.user_preferences['favorite_moods'])}")
+        if preferences['favorite_moods']:
+            profile_parts.append(f"Moods: {', '.join(preferences['favorite_moods'])}")
         
-        if self.user_preferences['favorite_themes']:
-            profile_parts.append(f"Themes: {', '.join(self.user_preferences['favorite_themes'])}")
+        if preferences['favorite_themes']:
+            profile_parts.append(f"Themes: {', '.join(preferences['favorite_themes'])}")
         
         # 添加一些用户听过的歌曲作为参考
-        recent_songs = self.user_history[-3:]  # 最近3首歌
+        recent_songs = context.user_history[-3:]  # 最近3首歌
         if recent_songs:
             song_names = [f"{song['title']} by {song['artist']}" for song in recent_songs]
             profile_parts.append(f"Recent songs: {', '.join(song_names)}")
@@ -219,36 +606,244 @@ class MusicRecommender:
         
         return "，".join(description_parts) + "。"
     
-    def get_recommendations(self, user_history: List[Dict], num_recommendations: int = 10) -> Dict:
-        """获取音乐推荐"""
-        # 分析用户历史
-        preferences = self.analyze_user_history(user_history)
-        
-        # 获取推荐
-        similarity_recommendations = self.recommend_by_similarity(num_recommendations)
-        preference_recommendations = self.recommend_by_preferences(num_recommendations)
+    def get_recommendations(self, user_history: List[Dict], num_recommendations: int = 10,
+                            filters: Optional[Dict] = None, merge_strategy: Optional[str] = None,
+                            diversity: Optional[float] = None, artist_cap: Optional[int] = None) -> Dict:
+        """获取音乐推荐
+        
+        filters 可限定情绪、流派和年份范围，例如 {'mood': 'sad', 'year_range': (1990, 2010)}；
+        merge_strategy 覆盖默认的候选合并策略（chain / interleave / score）；
+        diversity（0~1）和 artist_cap 覆盖默认的多样性重排设置，两者均未启用时不做重排
+        """
+        diversity = self.diversity if diversity is None else diversity
+        artist_cap = self.artist_cap if artist_cap is None else artist_cap
+        
+        # 分析用户历史（只保存在本次请求的上下文中）
+        context = self._request_context(user_history)
+        return self._recommend(context, num_recommendations, filters, merge_strategy, diversity, artist_cap)
+    
+    def _recommend(self, context: RequestContext, num_recommendations: int, filters: Optional[Dict],
+                   merge_strategy: Optional[str], diversity: float, artist_cap: Optional[int]) -> Dict:
+        """按请求上下文中的用户历史和偏好生成推荐"""
+        rerank = diversity > 0 or artist_cap is not None
+        
+        # 合并惰性候选流，凑满 num_recommendations 首不重复歌曲即停止；
+        # 需要多样性重排时改为取出有上限的候选池
+        pool_size = max(num_recommendations, self.diversity_pool_size) if rerank else num_recommendations
+        strategy = merge_strategy or self.merge_strategy
+        merged = merge_candidates(
+            self.candidate_streams(filters, pool_size, context),
+            self.music_data,
+            strategy,
+            per_stream_limit=pool_size
+        )
+        candidates = list(islice(merged, pool_size))
+        if rerank:
+            candidates = self._diversify(candidates, num_recommendations, diversity, artist_cap)
         
-        # 合并推荐结果（去重）
-        all_recommendations = similarity_recommendations + preference_recommendations
         unique_recommendations = []
-        seen_titles = set()
+        recommendation_details = []
         
-        for song in all_recommendations:
-            if song['title'] not in seen_titles:
-                unique_recommendations.append(song)
-                seen_titles.add(song['title'])
-                if len(unique_recommendations) >= num_recommendations:
-                    break
+        for song_id, score, source in candidates[:num_recommendations]:
+            unique_recommendations.append(self.music_data[song_id])
+            recommendation_details.append({
+                'rank': len(unique_recommendations),
+                'song_id': song_id,
+                'score': score,
+                'source': source
+            })
         
         # 生成歌单描述
         playlist_description = self.generate_playlist_description(unique_recommendations)
         
         return {
-            'user_preferences': preferences,
+            'user_preferences': context.user_preferences or empty_preferences(),
             'recommendations': unique_recommendations,
+            'recommendation_details': recommendation_details,
             'playlist_description': playlist_description,
             'total_recommendations': len(unique_recommendations)
         }
+    
+    def start_session(self, user_history: List[Dict], filters: Optional[Dict] = None,
+                      merge_strategy: Optional[str] = None, diversity: Optional[float] = None,
+                      artist_cap: Optional[int] = None) -> RecommendationSession:
+        """创建分页推荐会话：分析一次用户历史并建立惰性候选流，之后用 next_page 逐页获取
+        
+        merge_strategy 默认使用推荐器配置的候选合并策略，与 get_recommendations 一致；
+        启用多样性重排时，候选流前 diversity_pool_size 首按重排后的顺序给出，之后的候选保持合并顺序
+        """
+        diversity = self.diversity if diversity is None else diversity
+        artist_cap = self.artist_cap if artist_cap is None else artist_cap
+        
+        context = self._request_context(user_history)
+        candidates = merge_candidates(
+            self.candidate_streams(filters, context=context),
+            self.music_data,
+            merge_strategy or self.merge_strategy,
+            exclude_titles={song['title'] for song in user_history}
+        )
+        if diversity > 0 or artist_cap is not None:
+            pool = list(islice(candidates, self.diversity_pool_size))
+            candidates = chain(self._diversify(pool, len(pool), diversity, artist_cap), candidates)
+        session = RecommendationSession(self.music_data, context.user_preferences or empty_preferences(), candidates)
+        self.sessions.put(session)
+        return session
+    
+    def next_page(self, session_id: str, page_size: int = 10) -> Dict:
+        """获取会话的下一页推荐，代价与页大小成正比"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ValueError(f"推荐会话不存在或已过期: {session_id}")
+        
+        page = session.next_page(page_size)
+        page['user_preferences'] = session.user_preferences
+        page['playlist_description'] = self.generate_playlist_description(session.recommendations[:page['cursor']])
+        page['total_recommendations'] = page['cursor']
+        return page
+    
+    def warm_up(self, num_queries: int = 3, num_recommendations: int = 10,
+                latency_target_ms: Optional[float] = None) -> Dict:
+        """预热推荐器：加载曲库、模型和索引，并跑几次合成查询填充缓存
+        
+        先跑一次冷启动查询（计入 cold_start_ms），再跑 num_queries 次（至少一次）带历史的查询，覆盖画像检索路径。
+        返回各阶段耗时和查询延迟；指定 latency_target_ms 时，只有带历史查询的延迟均不超过目标才视为就绪。
+        """
+        timings = {}
+        
+        start = time.perf_counter()
+        self.song_id(self.music_data[0])
+        self.get_attribute_index()
+        rankings = self.get_popularity_rankings()
+        timings['catalog_ms'] = (time.perf_counter() - start) * 1000
+        
+        uses_embedding = self.similarity_mode == "profile" and self.similarity_backend == "embedding"
+        if uses_embedding:
+            start = time.perf_counter()
+            get_embedding_model()
+            timings['model_ms'] = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        self.load_index()
+        timings['index_ms'] = (time.perf_counter() - start) * 1000
+        
+        # 冷启动查询只走热门榜单，单独计时，不参与就绪判断
+        start = time.perf_counter()
+        self.get_recommendations([], num_recommendations)
+        timings['cold_start_ms'] = (time.perf_counter() - start) * 1000
+        
+        # 合成查询：用热门榜单中不同位置的歌曲组成历史
+        ranked_ids = rankings.ranking_for().tolist()
+        history_size = min(5, len(ranked_ids))
+        synthetic_histories = []
+        for i in range(max(1, num_queries)):
+            offset = (i * history_size) % max(1, len(ranked_ids) - history_size + 1)
+            synthetic_histories.append([self.music_data[j] for j in ranked_ids[offset:offset + history_size]])
+        
+        latencies = []
+        for history in synthetic_histories:
+            start = time.perf_counter()
+            self.get_recommendations(history, num_recommendations)
+            latencies.append((time.perf_counter() - start) * 1000)
+        
+        # 第一次带历史的查询往往仍包含惰性初始化开销，有多次查询时就绪判断以之后的查询为准
+        steady = latencies[1:] or latencies
+        self.ready = latency_target_ms is None or max(steady) <= latency_target_ms
+        self.warm_up_report = {
+            'ready': self.ready,
+            'timings': timings,
+            'query_latencies_ms': latencies,
+            'latency_target_ms': latency_target_ms,
+            'total_ms': sum(timings.values()) + sum(latencies)
+        }
+        return self.warm_up_report
+    
+    def is_ready(self) -> bool:
+        """是否已完成预热并满足延迟目标"""
+        return self.ready
+    
+    def get_user_history(self, user_id: str, history_size: int = 20) -> List[Dict]:
+        """从历史存储读取用户最近的听歌记录"""
+        if self.history_store is None:
+            raise ValueError("未配置听歌历史存储")
+        return [self.music_data[song_id] for song_id in self.history_store.recent_song_ids(user_id, history_size)
+                if 0 <= song_id < len(self.music_data)]
+    
+    def record_listen(self, user_id: str, song: Dict, timestamp: Optional[float] = None):
+        """把一次听歌记录追加到历史存储，并更新该用户的画像"""
+        if self.history_store is None:
+            raise ValueError("未配置听歌历史存储")
+        self.ingest_listens([(user_id, song, timestamp)])
+    
+    def ingest_listens(self, events: List[Tuple[str, Dict, Optional[float]]]) -> int:
+        """接入一批 (user_id, 歌曲, 时间戳) 听歌事件，返回接入的事件数
+        
+        事件批量追加到历史存储；每个受影响用户的画像增量更新，并只让该用户缓存的推荐结果和查询向量失效。
+        未配置历史存储时画像直接由接入的事件建立。
+        """
+        now = time.time()
+        records = []
+        songs_by_user: Dict[str, List[Dict]] = {}
+        for user_id, song, timestamp in events:
+            song_id = self.song_id(song)
+            if song_id is None:
+                continue
+            records.append((user_id, song_id, now if timestamp is None else timestamp))
+            songs_by_user.setdefault(user_id, []).append(self.music_data[song_id])
+        
+        # 先标记用户处理中再写历史存储：并发请求此时从存储加载的画像可能已包含这些事件，不能写回缓存后再被计入一次
+        self.user_states.begin_listens(songs_by_user)
+        if self.history_store is not None and records:
+            try:
+                self.history_store.append_many(records)
+            except Exception:
+                self.user_states.abort_listens(songs_by_user)
+                raise
+        for user_id, songs in songs_by_user.items():
+            self.user_states.apply_listens(user_id, songs, self.profile_window,
+                                           create=self.history_store is None)
+        return len(records)
+    
+    def start_ingestion(self, batch_size: int = 512, max_delay: float = 0.05,
+                        max_queue: int = 100000) -> ListenEventIngestor:
+        """启动后台事件接入：submit 的事件按批交给 ingest_listens 处理"""
+        return ListenEventIngestor(self.ingest_listens, batch_size, max_delay, max_queue).start()
+    
+    def _user_profile_snapshot(self, user_id: str) -> Tuple[List[Dict], Dict, int]:
+        """返回用户画像窗口内的历史、偏好和状态版本，首次访问时从历史存储加载画像"""
+        snapshot = self.user_states.profile_snapshot(user_id)
+        if snapshot is not None:
+            return snapshot
+        if self.history_store is None:
+            raise ValueError("未配置听歌历史存储")
+        version = self.user_states.version(user_id)
+        profile = UserProfile.from_songs(self.get_user_history(user_id, self.profile_window), self.profile_window)
+        # 写回缓存后画像可能被并发的 ingest_listens 修改，先在私有画像上取快照
+        snapshot = (profile.recent_songs(), profile.preferences(), version)
+        self.user_states.set_profile(user_id, profile, version)
+        return snapshot
+    
+    def get_recommendations_for_user(self, user_id: str, num_recommendations: int = 10,
+                                     history_size: int = 20, filters: Optional[Dict] = None) -> Dict:
+        """按用户ID生成推荐
+        
+        history_size 等于 profile_window 时直接使用增量维护的用户画像，否则从历史存储读取最近的听歌记录。
+        结果和画像查询向量按用户缓存，该用户有新的听歌事件时失效。
+        """
+        key = (num_recommendations, history_size, normalize_filters(filters))
+        cached = self.user_states.get_recommendations(user_id, key)
+        if cached is not None:
+            return cached
+        
+        if history_size == self.profile_window:
+            user_history, preferences, version = self._user_profile_snapshot(user_id)
+            context = RequestContext(user_history, preferences if user_history else {}, user_id, version)
+        else:
+            version = self.user_states.version(user_id)
+            context = self._request_context(self.get_user_history(user_id, history_size), user_id, version)
+        
+        result = self._recommend(context, num_recommendations, filters, None, self.diversity, self.artist_cap)
+        self.user_states.put_recommendations(user_id, key, result, version)
+        return result
 
 def create_sample_user_history() -> List[Dict]:
     """创建示例用户听歌历史"""
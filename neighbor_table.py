@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+歌曲近邻表 - 离线预计算每首歌的Top-N相似歌曲
+
+近邻表以紧凑数组保存：neighbor_ids[i] 为第i首歌的近邻歌曲ID（即在曲库中的下标），
+neighbor_scores[i] 为对应的余弦相似度。推荐时只需聚合用户历史歌曲的近邻，
+无需再调用嵌入模型。
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from typing import List, Dict, Iterable, Optional, Tuple
+import numpy as np
+import faiss
+
+# 近邻表默认保存路径
+DEFAULT_NEIGHBOR_TABLE_PATH = "music_neighbors.npz"
+
+class NeighborTable:
+    """歌曲ID -> Top-N近邻歌曲ID/相似度 的紧凑表"""
+
+    def __init__(self, neighbor_ids: np.ndarray, neighbor_scores: np.ndarray):
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+
+    @property
+    def num_songs(self) -> int:
+        return self.neighbor_ids.shape[0]
+
+    @property
+    def top_n(self) -> int:
+        return self.neighbor_ids.shape[1]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, top_n: int = 20, batch_size: int = 4096) -> "NeighborTable":
+        """由归一化后的歌曲向量矩阵构建近邻表"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        num_songs = vectors.shape[0]
+        top_n = min(top_n, num_songs - 1)
+
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+
+        neighbor_ids = np.full((num_songs, top_n), -1, dtype=np.int32)
+        neighbor_scores = np.zeros((num_songs, top_n), dtype=np.float16)
+
+        # 分批检索，多取一个结果用于剔除歌曲自身
+        for start in range(0, num_songs, batch_size):
+            end = min(start + batch_size, num_songs)
+            scores, ids = index.search(vectors[start:end], top_n + 1)
+            for row, song_id in enumerate(range(start, end)):
+                keep = ids[row] != song_id
+                row_ids = ids[row][keep][:top_n]
+                row_scores = scores[row][keep][:top_n]
+                neighbor_ids[song_id, :len(row_ids)] = row_ids
+                neighbor_scores[song_id, :len(row_scores)] = row_scores
+
+        return cls(neighbor_ids, neighbor_scores)
+
+    def save(self, filename: str = DEFAULT_NEIGHBOR_TABLE_PATH):
+        """保存近邻表到文件"""
+        np.savez(filename, neighbor_ids=self.neighbor_ids, neighbor_scores=self.neighbor_scores)
+
+    @classmethod
+    def load(cls, filename: str = DEFAULT_NEIGHBOR_TABLE_PATH) -> "NeighborTable":
+        """从文件加载近邻表"""
+        with np.load(filename) as data:
+            return cls(data['neighbor_ids'], data['neighbor_scores'])
+
+    def aggregate(self, history_ids: Iterable[int], num_recommendations: int = 10,
+                  exclude_ids: Optional[Iterable[int]] = None,
+                  allowed_mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """聚合历史歌曲的近邻，返回按累计相似度排序的 (歌曲ID, 分数) 列表
+
+        代价与历史长度 × N 成正比，与曲库大小无关。
+        """
+        history_ids = list(history_ids)
+        excluded = set(history_ids)
+        if exclude_ids is not None:
+            excluded.update(exclude_ids)
+
+        scores = defaultdict(float)
+        for song_id in history_ids:
+            for neighbor_id, score in zip(self.neighbor_ids[song_id], self.neighbor_scores[song_id]):
+                if neighbor_id < 0:
+                    break
+                if neighbor_id not in excluded and (allowed_mask is None or allowed_mask[neighbor_id]):
+                    scores[int(neighbor_id)] += float(score)
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:num_recommendations]
+
+def build_neighbor_table(music_data: List[Dict], top_n: int = 20, batch_size: int = 64,
+                         num_threads: Optional[int] = None, num_workers: int = 1) -> NeighborTable:
+    """为曲库计算近邻表（需要加载嵌入模型）"""
+    from music_embeddings import encode_music_catalog
+    vectors, stats = encode_music_catalog(music_data, batch_size, num_threads, num_workers)
+    print(f"  编码完成: {stats['num_songs']}首, {stats['songs_per_sec']:.1f}首/秒")
+    return NeighborTable.build(vectors, top_n)
+
+def main():
+    from music_data import load_music_data_from_file
+
+    parser = argparse.ArgumentParser(description="离线计算歌曲近邻表")
+    parser.add_argument('--database', type=str, default='music_database.json', help='曲库文件 (默认: music_database.json)')
+    parser.add_argument('--top-n', type=int, default=20, help='每首歌保存的近邻数量 (默认: 20)')
+    parser.add_argument('--batch-size', type=int, default=64, help='编码批大小 (默认: 64)')
+    parser.add_argument('--threads', type=int, default=None, help='每个进程的torch线程数 (默认: 自动)')
+    parser.add_argument('--workers', type=int, default=1, help='编码进程数 (默认: 1)')
+    parser.add_argument('--output', type=str, default=DEFAULT_NEIGHBOR_TABLE_PATH, help=f'输出文件 (默认: {DEFAULT_NEIGHBOR_TABLE_PATH})')
+    args = parser.parse_args()
+
+    music_data = load_music_data_from_file(args.database)
+    print(f"🚀 为 {len(music_data)} 首歌曲计算近邻表 (Top-{args.top_n})...")
+    start = time.perf_counter()
+    table = build_neighbor_table(music_data, args.top_n, args.batch_size, args.threads, args.workers)
+    table.save(args.output)
+    print(f"💾 近邻表已保存到: {args.output} ({time.perf_counter() - start:.1f}秒)")
+
+if __name__ == "__main__":
+    main()
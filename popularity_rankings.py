@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+预计算的热门榜单 - 新用户和空历史请求的冷启动推荐
+
+按 popularity 从高到低预先排好全局、各流派、各情绪、各年代的歌曲ID数组（int32）。
+冷启动请求直接从最贴近过滤条件的榜单头部取歌，不再随机抽样或扫描全曲库。
+榜单带有构建时间，超过刷新间隔后由调用方重建。
+"""
+
+import argparse
+import time
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+from catalog_filters import normalize_filters
+
+# 榜单默认保存路径
+DEFAULT_RANKINGS_PATH = "music_rankings.npz"
+
+def _ranked_ids(music_data: List[Dict], song_ids: Iterable[int]) -> np.ndarray:
+    # 按流行度降序，同分按曲库顺序
+    ranked = sorted(song_ids, key=lambda i: (-music_data[i]['popularity'], i))
+    return np.array(ranked, dtype=np.int32)
+
+class PopularityRankings:
+    """全局/流派/情绪/年代的热门歌曲ID榜单"""
+
+    def __init__(self, rankings: Dict[str, np.ndarray], popularity: np.ndarray, built_at: float):
+        self.rankings = rankings
+        self.popularity = popularity
+        self.built_at = built_at
+
+    @classmethod
+    def build(cls, music_data: List[Dict]) -> "PopularityRankings":
+        """由曲库构建全部榜单"""
+        groups: Dict[str, List[int]] = {}
+        for song_id, song in enumerate(music_data):
+            groups.setdefault(f"genre={song['genre']}", []).append(song_id)
+            groups.setdefault(f"mood={song['mood']}", []).append(song_id)
+            groups.setdefault(f"decade={song['year'] // 10 * 10}", []).append(song_id)
+
+        rankings = {'global': _ranked_ids(music_data, range(len(music_data)))}
+        for key, song_ids in groups.items():
+            rankings[key] = _ranked_ids(music_data, song_ids)
+
+        popularity = np.array([song['popularity'] for song in music_data], dtype=np.int16)
+        return cls(rankings, popularity, time.time())
+
+    def save(self, filename: str = DEFAULT_RANKINGS_PATH):
+        """保存榜单到文件"""
+        np.savez(filename, _popularity=self.popularity, _built_at=np.array(self.built_at), **self.rankings)
+
+    @classmethod
+    def load(cls, filename: str = DEFAULT_RANKINGS_PATH) -> "PopularityRankings":
+        """从文件加载榜单"""
+        with np.load(filename) as data:
+            rankings = {key: data[key] for key in data.files if not key.startswith('_')}
+            return cls(rankings, data['_popularity'], float(data['_built_at']))
+
+    def is_stale(self, max_age: float) -> bool:
+        """榜单是否已超过刷新间隔（秒）"""
+        return time.time() - self.built_at > max_age
+
+    def ranking_for(self, filters: Optional[Dict] = None) -> np.ndarray:
+        """选择与过滤条件最贴近的榜单：单一流派 > 单一情绪 > 单一年代 > 全局"""
+        key = dict(normalize_filters(filters) or ())
+        for field in ('genre', 'mood'):
+            values = key.get(field)
+            if values and len(values) == 1:
+                return self.rankings.get(f"{field}={values[0]}", np.empty(0, dtype=np.int32))
+        year_range = key.get('year_range')
+        if year_range and None not in year_range and year_range[0] // 10 == year_range[1] // 10:
+            return self.rankings.get(f"decade={year_range[0] // 10 * 10}", np.empty(0, dtype=np.int32))
+        return self.rankings['global']
+
+    def iter_top(self, filters: Optional[Dict] = None, allowed_mask: Optional[np.ndarray] = None,
+                 exclude_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, float]]:
+        """按热度顺序产出 (歌曲ID, 流行度)，跳过不满足掩码或被排除的歌曲"""
+        excluded = set(exclude_ids or ())
+        for song_id in self.ranking_for(filters).tolist():
+            if song_id in excluded or (allowed_mask is not None and not allowed_mask[song_id]):
+                continue
+            yield song_id, float(self.popularity[song_id])
+
+    def top(self, k: int = 10, filters: Optional[Dict] = None, allowed_mask: Optional[np.ndarray] = None,
+            exclude_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """取榜单前k首"""
+        result = []
+        for item in self.iter_top(filters, allowed_mask, exclude_ids):
+            result.append(item)
+            if len(result) >= k:
+                break
+        return result
+
+def main():
+    from music_data import load_music_data_from_file
+
+    parser = argparse.ArgumentParser(description="预计算热门榜单")
+    parser.add_argument('--database', type=str, default='music_database.json', help='曲库文件 (默认: music_database.json)')
+    parser.add_argument('--output', type=str, default=DEFAULT_RANKINGS_PATH, help=f'输出文件 (默认: {DEFAULT_RANKINGS_PATH})')
+    args = parser.parse_args()
+
+    music_data = load_music_data_from_file(args.database)
+    rankings = PopularityRankings.build(music_data)
+    rankings.save(args.output)
+    print(f"💾 {len(rankings.rankings)} 个榜单已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
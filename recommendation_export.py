@@ -0,0 +1,75 @@
+"""
+推荐结果列式导出 - 以Parquet行组流式追加大批量推荐结果
+
+每条推荐对应一行：user_id, rank, song_id, title, score, source。
+写入端在内存中累积到 row_group_size 行后写出一个行组，适合导出海量歌单；
+读取端可以只扫描需要的列。
+"""
+
+from typing import List, Dict, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+RECOMMENDATION_SCHEMA = pa.schema([
+    ('user_id', pa.string()),
+    ('rank', pa.int32()),
+    ('song_id', pa.int32()),
+    ('title', pa.string()),
+    ('score', pa.float32()),
+    ('source', pa.dictionary(pa.int8(), pa.string())),
+])
+
+class RecommendationParquetWriter:
+    """流式追加推荐结果的Parquet写入器"""
+
+    def __init__(self, filename: str, row_group_size: int = 100_000, compression: str = 'zstd'):
+        self.filename = filename
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(filename, RECOMMENDATION_SCHEMA, compression=compression)
+        self._columns = {name: [] for name in RECOMMENDATION_SCHEMA.names}
+        self._buffered_rows = 0
+        self.rows_written = 0
+
+    def append(self, user_id: str, recommendations: Dict):
+        """追加一个用户的推荐结果（get_recommendations 的返回值）"""
+        columns = self._columns
+        for detail, song in zip(recommendations['recommendation_details'], recommendations['recommendations']):
+            columns['user_id'].append(user_id)
+            columns['rank'].append(detail['rank'])
+            columns['song_id'].append(detail['song_id'])
+            columns['title'].append(song['title'])
+            columns['score'].append(detail['score'])
+            columns['source'].append(detail['source'])
+            self._buffered_rows += 1
+
+        if self._buffered_rows >= self.row_group_size:
+            self.flush()
+
+    def append_batch(self, batch: List[Dict]):
+        """追加一批 {'user_id': ..., 'recommendations': ...} 记录"""
+        for item in batch:
+            self.append(item['user_id'], item['recommendations'])
+
+    def flush(self):
+        """把缓冲的行写成一个行组"""
+        if not self._buffered_rows:
+            return
+        table = pa.Table.from_pydict(self._columns, schema=RECOMMENDATION_SCHEMA)
+        self._writer.write_table(table, row_group_size=table.num_rows)
+        self.rows_written += self._buffered_rows
+        self._columns = {name: [] for name in RECOMMENDATION_SCHEMA.names}
+        self._buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def read_recommendations(filename: str, columns: Optional[List[str]] = None, filters=None) -> pa.Table:
+    """读取导出的推荐结果，可只读取部分列或按条件过滤"""
+    return pq.read_table(filename, columns=columns, filters=filters)
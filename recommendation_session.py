@@ -0,0 +1,109 @@
+"""
+推荐会话 - 保存排好序的候选流和游标，支持"加载更多"分页
+
+会话创建时分析一次用户历史并建立合并后的惰性候选流（见 candidate_merge）；之后每次
+翻页只从候选流中继续取出下一页，不再重新画像、编码和检索全部结果。会话保存在有容量上限的缓存中，
+空闲超时或超出容量时按最久未使用淘汰。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Iterator, Optional, Tuple
+
+class RecommendationSession:
+    """一个用户的分页推荐会话"""
+
+    def __init__(self, music_data: List[Dict], user_preferences: Dict,
+                 candidates: Iterator[Tuple[int, float, str]], session_id: Optional[str] = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.music_data = music_data
+        self.user_preferences = user_preferences
+        self.candidates = candidates
+        self.exhausted = False
+        self.recommendations: List[Dict] = []
+        self.recommendation_details: List[Dict] = []
+        self.cursor = 0
+        self.last_access = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _pull(self) -> bool:
+        """从合并后的候选流取一首歌追加到结果，候选流耗尽时返回False"""
+        item = next(self.candidates, None)
+        if item is None:
+            self.exhausted = True
+            return False
+        song_id, score, source = item
+        self.recommendations.append(self.music_data[song_id])
+        self.recommendation_details.append({
+            'rank': len(self.recommendations),
+            'song_id': song_id,
+            'score': score,
+            'source': source
+        })
+        return True
+
+    def next_page(self, page_size: int = 10) -> Dict:
+        """返回下一页推荐并移动游标"""
+        with self._lock:
+            self.last_access = time.monotonic()
+            start = self.cursor
+            while len(self.recommendations) < start + page_size and self._pull():
+                pass
+            end = min(start + page_size, len(self.recommendations))
+            self.cursor = end
+            return {
+                'session_id': self.session_id,
+                'recommendations': self.recommendations[start:end],
+                'recommendation_details': self.recommendation_details[start:end],
+                'cursor': end,
+                'has_more': not self.exhausted or end < len(self.recommendations)
+            }
+
+class RecommendationSessionCache:
+    """有容量上限、按空闲时间淘汰的会话缓存"""
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, RecommendationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float):
+        # 按最近访问顺序排列，从最久未访问的一端开始淘汰
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access < self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+
+    def put(self, session: RecommendationSession):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[RecommendationSession]:
+        """获取会话并刷新其访问时间，不存在或已过期时返回None"""
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,113 @@
+"""
+稀疏TF-IDF相似度引擎 - 无需嵌入模型的相似度推荐后端
+
+把每首歌的流派、情绪、节奏、主题和标签编码为带字段前缀的词项（如 "genre=Pop"、
+"tag=piano"），构建按行L2归一化的稀疏TF-IDF矩阵；用户画像同样编码为稀疏向量，
+一次稀疏矩阵-向量乘法即可得到全部歌曲的余弦相似度。
+"""
+
+from typing import List, Dict, Iterable, Optional, Tuple
+import numpy as np
+from scipy import sparse
+
+def song_terms(song: Dict) -> List[str]:
+    """提取歌曲的元数据词项"""
+    terms = [
+        f"genre={song['genre']}",
+        f"mood={song['mood']}",
+        f"tempo={song['tempo']}",
+        f"theme={song['lyrics_theme']}",
+    ]
+    terms.extend(f"tag={tag}" for tag in song['tags'])
+    return terms
+
+def profile_terms(user_preferences: Dict, recent_songs: List[Dict]) -> List[str]:
+    """把用户偏好和最近听过的歌曲编码为词项，与 _create_user_profile 的内容对应"""
+    terms = [f"genre={g}" for g in user_preferences.get('favorite_genres', [])]
+    terms.extend(f"mood={m}" for m in user_preferences.get('favorite_moods', []))
+    terms.extend(f"tempo={t}" for t in user_preferences.get('favorite_tempos', []))
+    terms.extend(f"theme={th}" for th in user_preferences.get('favorite_themes', []))
+    for song in recent_songs:
+        terms.extend(f"tag={tag}" for tag in song['tags'])
+    return terms
+
+class TfidfSimilarityIndex:
+    """基于稀疏TF-IDF矩阵的歌曲相似度索引"""
+
+    def __init__(self, matrix: sparse.csr_matrix, vocabulary: Dict[str, int], idf: np.ndarray):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.idf = idf
+
+    @classmethod
+    def from_music_data(cls, music_data: List[Dict]) -> "TfidfSimilarityIndex":
+        """由曲库构建索引，第i行对应 music_data[i]"""
+        vocabulary = {}
+        indptr = [0]
+        indices = []
+        for song in music_data:
+            # 同一首歌内重复的词项只计一次
+            term_ids = {vocabulary.setdefault(term, len(vocabulary)) for term in song_terms(song)}
+            indices.extend(sorted(term_ids))
+            indptr.append(len(indices))
+
+        num_songs = len(music_data)
+        data = np.ones(len(indices), dtype=np.float32)
+        matrix = sparse.csr_matrix(
+            (data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(num_songs, len(vocabulary))
+        )
+
+        # 平滑IDF，与常见实现一致
+        df = np.bincount(matrix.indices, minlength=len(vocabulary))
+        idf = (np.log((1 + num_songs) / (1 + df)) + 1).astype(np.float32)
+
+        matrix = matrix.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+        return cls(matrix, vocabulary, idf)
+
+    def memory_bytes(self) -> int:
+        """稀疏矩阵和IDF数组占用的字节数"""
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes + self.idf.nbytes
+
+    def query_vector(self, terms: Iterable[str]) -> Optional[np.ndarray]:
+        """把词项编码为归一化的稠密查询向量，词项均不在词表中时返回None"""
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term in terms:
+            term_id = self.vocabulary.get(term)
+            if term_id is not None:
+                vector[term_id] += self.idf[term_id]
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """返回所有歌曲与查询向量的余弦相似度"""
+        return self.matrix.dot(query)
+
+    def search(self, terms: Iterable[str], k: int = 10,
+               exclude_ids: Optional[Iterable[int]] = None,
+               allowed_mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """检索最相似的k首歌，返回 (歌曲ID, 分数) 列表"""
+        query = self.query_vector(terms)
+        if query is None:
+            return []
+
+        scores = self.scores(query)
+        if allowed_mask is not None:
+            scores[~allowed_mask] = -np.inf
+        if exclude_ids is not None:
+            exclude_ids = list(exclude_ids)
+            if exclude_ids:
+                scores[exclude_ids] = -np.inf
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(i), float(scores[i])) for i in top if np.isfinite(scores[i])]
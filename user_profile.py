@@ -0,0 +1,93 @@
+"""
+用户偏好画像 - 由最近若干次播放增量维护的流派/情绪/节奏/主题计数和年代、流行度统计
+
+画像保存一个最多 window 首歌的滑动窗口：新增播放时累加计数，挤出窗口的播放同时扣减，
+更新一次播放的代价与历史长度无关。偏好字段与 MusicRecommender.analyze_user_history 的返回值一致。
+"""
+
+from collections import Counter, deque
+from typing import List, Dict, Iterable, Optional
+import numpy as np
+
+# 参与计数的歌曲字段，以及偏好中保留的前几名
+PROFILE_FIELDS = {
+    'genre': ('favorite_genres', 3),
+    'mood': ('favorite_moods', 2),
+    'tempo': ('favorite_tempos', 2),
+    'lyrics_theme': ('favorite_themes', 3),
+}
+
+def empty_preferences() -> Dict:
+    """没有听歌历史时的偏好"""
+    return {
+        'favorite_genres': [],
+        'favorite_moods': [],
+        'favorite_tempos': [],
+        'favorite_themes': [],
+        'average_year': 0,
+        'year_range': 0,
+        'average_popularity': 0,
+        'total_songs': 0
+    }
+
+class UserProfile:
+    """一个用户最近 window 次播放的增量偏好画像（window 为None时不限长度）"""
+
+    def __init__(self, window: Optional[int] = 20):
+        self.window = window
+        self.songs: deque = deque()
+        self.counts = {field: Counter() for field in PROFILE_FIELDS}
+        self.year_sum = 0
+        self.popularity_sum = 0
+
+    @classmethod
+    def from_songs(cls, songs: Iterable[Dict], window: Optional[int] = None) -> "UserProfile":
+        """由按时间排列的听歌历史构建画像"""
+        profile = cls(window)
+        profile.extend(songs)
+        return profile
+
+    def add(self, song: Dict):
+        """追加一次播放，超出窗口时挤出最早的播放"""
+        self.songs.append(song)
+        for field, counter in self.counts.items():
+            counter[song[field]] += 1
+        self.year_sum += song['year']
+        self.popularity_sum += song['popularity']
+
+        if self.window is not None and len(self.songs) > self.window:
+            evicted = self.songs.popleft()
+            for field, counter in self.counts.items():
+                counter[evicted[field]] -= 1
+                if counter[evicted[field]] <= 0:
+                    del counter[evicted[field]]
+            self.year_sum -= evicted['year']
+            self.popularity_sum -= evicted['popularity']
+
+    def extend(self, songs: Iterable[Dict]):
+        for song in songs:
+            self.add(song)
+
+    def recent_songs(self, n: Optional[int] = None) -> List[Dict]:
+        """窗口内最近n首歌，按时间先后排列"""
+        songs = list(self.songs)
+        return songs if n is None else songs[-n:]
+
+    def preferences(self) -> Dict:
+        """当前窗口的偏好特征"""
+        total = len(self.songs)
+        if not total:
+            return empty_preferences()
+
+        preferences = {}
+        for field, (key, top) in PROFILE_FIELDS.items():
+            preferences[key] = [value for value, _ in self.counts[field].most_common(top)]
+
+        years = [song['year'] for song in self.songs]
+        preferences.update({
+            'average_year': np.float64(self.year_sum / total),
+            'year_range': max(years) - min(years),
+            'average_popularity': np.float64(self.popularity_sum / total),
+            'total_songs': total
+        })
+        return preferences
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+磁盘向量索引 - 以FAISS文件格式持久化曲库向量，工作进程以只读内存映射方式打开
+
+索引为内积度量的 IndexIVFFlat，向量ID即歌曲在曲库中的下标。以 IO_FLAG_MMAP
+打开时倒排表数据直接映射自文件：多个工作进程共享同一份页缓存，启动时不会把
+索引拷贝进私有内存，超过内存大小的曲库也可检索。
+"""
+
+import argparse
+import math
+import time
+from typing import Iterable, Optional, Tuple
+import numpy as np
+import faiss
+
+# 磁盘索引默认保存路径
+DEFAULT_INDEX_PATH = "music_index.faiss"
+
+def build_ivf_index(vectors: np.ndarray, nlist: Optional[int] = None) -> faiss.Index:
+    """由归一化后的歌曲向量构建IVF索引，第i个向量的ID为i"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_songs, dim = vectors.shape
+    if nlist is None:
+        nlist = max(1, int(math.sqrt(num_songs)))
+    nlist = min(nlist, num_songs)
+
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add_with_ids(vectors, np.arange(num_songs, dtype=np.int64))
+    # 保存直接映射，便于按歌曲ID取回向量
+    index.make_direct_map()
+    return index
+
+def build_flat_index(vectors: np.ndarray) -> faiss.Index:
+    """构建常驻内存的精确内积索引，第i个向量的ID为i"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+def save_vector_index(index: faiss.Index, filename: str = DEFAULT_INDEX_PATH):
+    """把索引写入磁盘"""
+    faiss.write_index(index, filename)
+
+def open_mmap_index(filename: str = DEFAULT_INDEX_PATH, nprobe: int = 8,
+                    num_songs: Optional[int] = None) -> faiss.Index:
+    """以只读内存映射方式打开磁盘索引；指定 num_songs 时校验索引的向量数与曲库一致"""
+    index = faiss.read_index(filename, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if num_songs is not None and index.ntotal != num_songs:
+        raise ValueError(f"磁盘索引与曲库不匹配: {filename} 有 {index.ntotal} 个向量，曲库有 {num_songs} 首歌曲")
+    set_nprobe(index, nprobe)
+    return index
+
+def set_nprobe(index: faiss.Index, nprobe: int):
+    """设置IVF索引检索的倒排桶数量，非IVF索引忽略"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+
+def ivf_nlist(index: faiss.Index) -> Optional[int]:
+    """IVF索引的倒排桶数量，非IVF索引返回None"""
+    try:
+        return faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        return None
+
+def make_search_params(index: faiss.Index, allowed_mask: Optional[np.ndarray] = None,
+                       exclude_ids: Optional[Iterable[int]] = None, nprobe: Optional[int] = None):
+    """构建带ID选择器的检索参数，把排除的歌曲和属性过滤下推到索引内部
+
+    返回 (params, keepalive)；keepalive 持有选择器引用的底层对象，检索完成前需保持存活。
+    没有任何约束时返回 (None, None)。
+    """
+    exclude_ids = np.fromiter(exclude_ids or (), dtype=np.int64)
+    keepalive = []
+
+    if allowed_mask is not None:
+        allowed = np.array(allowed_mask, dtype=bool)
+        allowed[exclude_ids[exclude_ids < len(allowed)]] = False
+        bitmap = np.packbits(allowed, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        keepalive.append(bitmap)
+    elif len(exclude_ids):
+        excluded = faiss.IDSelectorBatch(exclude_ids)
+        selector = faiss.IDSelectorNot(excluded)
+        keepalive.append(excluded)
+    else:
+        selector = None
+
+    try:
+        faiss.extract_index_ivf(index)
+        is_ivf = True
+    except RuntimeError:
+        is_ivf = False
+
+    if selector is None and (nprobe is None or not is_ivf):
+        return None, None
+
+    if is_ivf:
+        params = faiss.SearchParametersIVF()
+        if nprobe is not None:
+            params.nprobe = nprobe
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+        keepalive.append(selector)
+    return params, keepalive
+
+def search_index(index: faiss.Index, query: np.ndarray, k: int, params=None) -> Tuple[np.ndarray, np.ndarray]:
+    """检索单个查询向量，返回 (歌曲ID数组, 分数数组)，已去掉无效结果"""
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    k = min(k, index.ntotal)
+    if params is None:
+        scores, ids = index.search(query, k)
+    else:
+        scores, ids = index.search(query, k, params=params)
+    valid = ids[0] >= 0
+    return ids[0][valid], scores[0][valid]
+
+def reconstruct_vectors(index: faiss.Index, song_ids: Iterable[int]) -> np.ndarray:
+    """按歌曲ID取回索引中保存的向量（IVF索引需要直接映射）"""
+    song_ids = np.asarray(list(song_ids), dtype=np.int64)
+    if len(song_ids) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(song_ids)
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """估算索引数据占用的字节数（内存映射打开的索引按映射的数据量计）"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index.ntotal * index.code_size
+    # 向量编码 + 倒排表中的ID + 直接映射，再加上粗量化中心
+    return ivf.ntotal * (ivf.code_size + 16) + ivf.quantizer.ntotal * ivf.d * 4
+
+def main():
+    from music_data import load_music_data_from_file
+    from music_embeddings import encode_music_catalog
+
+    parser = argparse.ArgumentParser(description="构建磁盘向量索引")
+    parser.add_argument('--database', type=str, default='music_database.json', help='曲库文件 (默认: music_database.json)')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF倒排桶数量 (默认: sqrt(歌曲数))')
+    parser.add_argument('--batch-size', type=int, default=64, help='编码批大小 (默认: 64)')
+    parser.add_argument('--threads', type=int, default=None, help='每个进程的torch线程数 (默认: 自动)')
+    parser.add_argument('--workers', type=int, default=1, help='编码进程数 (默认: 1)')
+    parser.add_argument('--output', type=str, default=DEFAULT_INDEX_PATH, help=f'输出文件 (默认: {DEFAULT_INDEX_PATH})')
+    args = parser.parse_args()
+
+    music_data = load_music_data_from_file(args.database)
+    print(f"🚀 为 {len(music_data)} 首歌曲构建磁盘向量索引...")
+    start = time.perf_counter()
+    vectors, stats = encode_music_catalog(music_data, args.batch_size, args.threads, args.workers)
+    print(f"  编码完成: {stats['num_songs']}首, {stats['songs_per_sec']:.1f}首/秒")
+    index = build_ivf_index(vectors, args.nlist)
+    save_vector_index(index, args.output)
+    print(f"💾 索引已保存到: {args.output} ({time.perf_counter() - start:.1f}秒)")
+
+if __name__ == "__main__":
+    main()